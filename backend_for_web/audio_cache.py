@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+TTS 音频缓存 / 语音识别结果缓存
+TTS 按 (text, voice, aue) 的哈希寻址：同一段文本只合成一次，音频存进内容寻址的 AudioStore，
+医生提醒群发和 /api/speak 共用同一份缓存；
+识别结果按上传音频的哈希缓存，重复上传的录音不再调用讯飞
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# 缓存命中时更新音频修改时间的最小间隔（秒）
+TOUCH_INTERVAL = 3600
+# 别名不存在的结果在本进程内缓存的秒数（预渲染反复检查同一段未合成的文本时不用每次都读存储）
+MISS_TTL = 60
+
+# 输出编码 -> 文件扩展名
+AUE_EXT = {
+    "lame": "mp3",
+    "raw": "pcm",
+}
+
+
+class TtsAudioCache:
+    """
+    按文本寻址的 TTS 缓存，音频本身保存在内容寻址的 AudioStore 中
+      - 文本哈希 -> 音频 key 的对应关系写成存储里的别名文件，进程重启、多进程之间共享
+      - 内存中维护一个有上限的 LRU 索引（文本哈希 -> 音频 key），淘汰只影响索引，不删文件
+      - 别名不存在的结果缓存 MISS_TTL 秒；本进程合成后立即清除，其他进程合成的最多晚 MISS_TTL 秒命中
+      - 同一个 key 并发请求时只有一个线程真正调用合成，其余线程等待结果
+      - 读存储（exists / 读别名，对象存储时是网络请求）都在 self._lock 之外，锁内只读写内存索引
+    """
+
+    def __init__(self, store, synthesize, max_entries: int = 2048):
+        """
+        :param store: 音频存储（audio_store.AudioStore）
+        :param synthesize: 合成函数，签名同 tts_iflytek(text, voice=..., aue=..., priority=...)
+        :param max_entries: LRU 索引最多保存的条目数
+        """
+        self.store = store
+        self.synthesize = synthesize
+        self.max_entries = max_entries
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._touched = {}
+        self._missing = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, voice: str, aue: str) -> str:
+        raw = f"{voice}\x00{aue}\x00{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _lookup(self, key: str):
+        """命中索引或存储里已有别名时返回音频 key（调用方不能持有 self._lock）"""
+        now = time.monotonic()
+        with self._lock:
+            blob_key = self._index.get(key)
+            missing_until = self._missing.get(key)
+        if blob_key:
+            if self.store.exists(blob_key):
+                with self._lock:
+                    if key in self._index:
+                        self._index.move_to_end(key)
+                self._touch(blob_key)
+                return blob_key
+            # 音频已被保留任务清理
+            with self._lock:
+                if self._index.get(key) == blob_key:
+                    del self._index[key]
+        elif missing_until is not None and missing_until > now:
+            return None
+        # 索引已淘汰、进程刚启动或其他进程合成过，读别名文件
+        blob_key = self.store.resolve_alias(key)
+        with self._lock:
+            if blob_key:
+                self._remember(key, blob_key)
+            else:
+                self._missing[key] = now + MISS_TTL
+                self._missing.move_to_end(key)
+                while len(self._missing) > self.max_entries:
+                    self._missing.popitem(last=False)
+        return blob_key
+
+    def _touch(self, blob_key: str):
+        """命中时更新音频的修改时间，保留任务按修改时间做 LRU 淘汰；同一文件每小时最多更新一次"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(blob_key, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+                return
+            self._touched[blob_key] = now
+            if len(self._touched) > self.max_entries * 2:
+                self._touched.clear()
+        self.store.touch(blob_key)
+
+    def _remember(self, key: str, blob_key: str):
+        """写入 LRU 索引（调用方需持有 self._lock）"""
+        self._missing.pop(key, None)
+        self._index[key] = blob_key
+        self._index.move_to_end(key)
+        while len(self._index) > self.max_entries:
+            self._index.popitem(last=False)
+
+    def _save(self, key: str, aue: str, audio_bytes: bytes) -> str:
+        blob_key = self.store.put_bytes(audio_bytes, AUE_EXT.get(aue, "bin"))
+        self.store.set_alias(key, blob_key)
+        with self._lock:
+            self._remember(key, blob_key)
+        return self.store.url_for(blob_key)
+
+    def lookup(self, text: str, voice: str = "xiaoyan", aue: str = "lame"):
+        """只查缓存不合成：命中返回访问路径，未命中返回 None（计入命中/未命中统计）"""
+        blob_key = self._lookup(self.make_key(text, voice, aue))
+        with self._lock:
+            if blob_key:
+                self.hits += 1
+                return self.store.url_for(blob_key)
+            self.misses += 1
+            return None
+
+    def contains(self, text: str, voice: str = "xiaoyan", aue: str = "lame") -> bool:
+        """音频是否已经落盘（不计入命中统计，供预渲染判断是否还需要合成）"""
+        return self._lookup(self.make_key(text, voice, aue)) is not None
+
+    def store_audio(self, text: str, voice: str, aue: str, audio_bytes: bytes) -> str:
+        """保存外部已合成好的音频（如流式合成结束后），返回访问路径"""
+        return self._save(self.make_key(text, voice, aue), aue, audio_bytes)
+
+    def get_or_synthesize(self, text: str, voice: str = "xiaoyan", aue: str = "lame", priority: str = "interactive") -> str:
+        """
+        返回音频的访问路径（/static/audio/xx/xx/<sha256>.mp3），未命中时调用合成函数并落盘
+        priority 透传给合成函数的准入控制（批量任务使用 bulk）
+        """
+        key = self.make_key(text, voice, aue)
+
+        blob_key = self._lookup(key)
+        with self._lock:
+            if blob_key:
+                self.hits += 1
+                return self.store.url_for(blob_key)
+            key_lock = self._inflight.get(key)
+            if key_lock is None:
+                key_lock = self._inflight[key] = threading.Lock()
+
+        with key_lock:
+            # 等锁期间其他线程可能已经合成完毕（合成完成时已写入索引）
+            blob_key = self._lookup(key)
+            with self._lock:
+                if blob_key:
+                    self.hits += 1
+                    return self.store.url_for(blob_key)
+                self.misses += 1
+            try:
+                audio_bytes = self.synthesize(text, voice=voice, aue=aue, priority=priority)
+                if not audio_bytes:
+                    raise RuntimeError("语音生成失败：未获得音频数据")
+                return self._save(key, aue, audio_bytes)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "negative_entries": len(self._missing),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class AsrResultCache:
+    """
+    语音识别结果缓存
+    按 (上传音频字节, 语种) 的哈希寻址，弱网重传同一段录音时直接返回上次的识别结果
+      - 每条结果有过期时间（TTL）
+      - 条目数有上限，超出时按 LRU 淘汰
+    """
+
+    def __init__(self, ttl_seconds: int = 600, max_entries: int = 1024):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(audio_bytes: bytes, language: str) -> str:
+        digest = hashlib.sha256(audio_bytes)
+        digest.update(b"\x00" + language.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """命中返回识别文本，未命中或已过期返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._entries[key] = (text, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+按客户端选择的音频规格（profile）返回音频
+农村 2G/3G 网络下提醒音频的下载最慢，客户端可以通过 ?profile=low 或请求头 X-Audio-Profile
+（或浏览器/小程序的 Save-Data: on）选择低码率版本。
+每个规格针对同一份源音频（内容哈希）只转码一次，结果保存在存储的 audio/variants/<profile>/ 下，之后直接复用。
+"""
+
+import threading
+
+from audio_store import CONTENT_TYPES
+
+# 规格名 -> (扩展名, ffmpeg 输出参数)；standard 为原始音频
+AUDIO_PROFILES = {
+    "standard": None,
+    # 单声道 16kHz、24kbps mp3：语音清晰度足够，体积约为原始音频的 1/2~1/3，所有播放器都支持
+    "low": ("mp3", ["-ac", "1", "-ar", "16000", "-b:a", "24k", "-f", "mp3"]),
+    # 单声道 16kbps Opus：体积最小，需要客户端支持 ogg/opus
+    "opus": ("ogg", ["-ac", "1", "-c:a", "libopus", "-b:a", "16k", "-application", "voip", "-f", "ogg"]),
+}
+DEFAULT_PROFILE = "standard"
+
+
+def pick_profile(request) -> str:
+    """按 ?profile= > X-Audio-Profile 头 > Save-Data 头 的顺序选择规格，无法识别时使用原始音频"""
+    profile = (request.args.get("profile") or request.headers.get("X-Audio-Profile") or "").strip().lower()
+    if not profile and request.headers.get("Save-Data", "").lower() == "on":
+        profile = "low"
+    return profile if profile in AUDIO_PROFILES else DEFAULT_PROFILE
+
+
+class AudioProfileCache:
+    """
+    音频规格转码缓存
+    variant key 由源音频的 key 和规格名确定（audio/variants/<profile>/<xx>/<sha256>-<profile>.<源扩展名>.<ext>），
+    存储里已有就直接返回；同一个 variant 并发请求时只转码一次
+    """
+
+    def __init__(self, store, transcode):
+        """
+        :param store: 音频存储（audio_store.AudioStore）
+        :param transcode: 转码函数 transcode(bytes, output_args) -> bytes（tts.ffmpeg_transcode）
+        """
+        self.store = store
+        self.transcode = transcode
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.transcoded = 0
+        self.failed = 0
+        self.bytes_saved = 0
+
+    def variant_key(self, key: str, profile: str) -> str:
+        ext = AUDIO_PROFILES[profile][0]
+        digest, source_ext = key.rsplit("/", 1)[-1].split(".", 1)
+        return f"{self.store.prefix}/variants/{profile}/{digest[:2]}/{digest}-{profile}.{source_ext}.{ext}"
+
+    def get(self, key: str, profile: str) -> str:
+        """返回指定规格的音频 key；原始规格或转码失败时返回源音频 key"""
+        if AUDIO_PROFILES.get(profile) is None or self.store.is_variant_key(key):
+            return key
+        variant = self.variant_key(key, profile)
+        if self.store.exists(variant):
+            self.hits += 1
+            return variant
+
+        with self._lock:
+            key_lock = self._inflight.get(variant)
+            if key_lock is None:
+                key_lock = self._inflight[variant] = threading.Lock()
+        with key_lock:
+            try:
+                if self.store.exists(variant):
+                    self.hits += 1
+                    return variant
+                source = self.store.backend.get_bytes(key)
+                if not source:
+                    return key
+                ext = AUDIO_PROFILES[profile][0]
+                data = self.transcode(source, AUDIO_PROFILES[profile][1])
+                # 转码结果反而更大（源音频本来就是低码率）时保存源音频，避免之后每次请求都重新转码
+                if len(data) >= len(source) and ext == key.rsplit(".", 1)[-1]:
+                    data = source
+                self.store.backend.put_bytes(variant, data, content_type=CONTENT_TYPES.get(ext))
+                self.transcoded += 1
+                self.bytes_saved += len(source) - len(data)
+                return variant
+            except Exception as e:
+                self.failed += 1
+                print(f"音频转码失败（{profile}）: {e}")
+                return key
+            finally:
+                with self._lock:
+                    self._inflight.pop(variant, None)
+
+    def stats(self) -> dict:
+        return {
+            "profiles": list(AUDIO_PROFILES),
+            "hits": self.hits,
+            "transcoded": self.transcoded,
+            "failed": self.failed,
+            "bytes_saved_on_transcode": self.bytes_saved,
+        }
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+音频保留策略（每天凌晨由定时任务执行，也可以用 flask audio-retention 手动执行）
+  1. 过期提醒：按主键分批扫描超过保留天数且已听过的患者提醒，
+     同一批里涉及的音频用一条查询判断是否还有未过期/未听的提醒引用，没有的批量删除
+  2. 孤儿文件：遍历存储中的全部音频，分批对照 patient_reminders，
+     没有任何提醒引用且超过宽限期的文件（/api/speak 缓存、写了一半的临时文件等）删除；
+     static/ 根目录下迁移前遗留的音频和转码临时文件同样处理
+  3. 容量上限：总占用超过配额时，在没有“有效提醒”引用的音频里按修改时间从旧到新淘汰（LRU，
+     TTS 缓存命中时会更新修改时间）；还在宽限期内、没有提醒引用的音频（刚合成、即将写入提醒）不淘汰。
+     对象存储无法更新修改时间（touch 为空操作），这时按上传时间淘汰，常用的 TTS 缓存也会被淘汰后重新合成
+  4. 删除指向已删除音频的 TTS 别名，以及源音频已删除的其他规格音频（audio_profiles）
+每一步都只保留当前批次在内存里，返回回收的字节数和耗时
+"""
+
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+from models import db, PatientReminder
+
+# static/ 根目录下迁移前遗留的音频 / 临时文件
+LEGACY_AUDIO_EXTS = (".mp3", ".wav", ".pcm", ".tmp")
+
+
+def _live_urls(urls, cutoff) -> set:
+    """urls 中仍被有效提醒（未过期或未听）引用的访问路径"""
+    if not urls:
+        return set()
+    return set(row[0] for row in db.session.query(PatientReminder.audio_path).filter(
+        PatientReminder.audio_path.in_(list(urls)),
+        db.or_(PatientReminder.created_at >= cutoff, PatientReminder.is_listened == False)
+    ).distinct())
+
+
+def _referenced_urls(urls) -> set:
+    """urls 中被任意提醒引用的访问路径"""
+    if not urls:
+        return set()
+    return set(row[0] for row in db.session.query(PatientReminder.audio_path).filter(
+        PatientReminder.audio_path.in_(list(urls))
+    ).distinct())
+
+
+class AudioRetention:
+    """音频保留任务，每次 run() 返回一份统计报告"""
+
+    def __init__(self, store, static_dir: str, retention_days: int = 30, orphan_grace_hours: int = 168,
+                 quota_bytes: int = 0, batch_size: int = 500):
+        """
+        :param store: 音频存储（audio_store.AudioStore）
+        :param static_dir: 本机 static 目录（清理迁移前遗留的文件）
+        :param retention_days: 已听提醒的音频保留天数
+        :param orphan_grace_hours: 没有提醒引用的音频至少保留的时长（/api/speak 缓存、刚合成还没写入提醒的音频）
+        :param quota_bytes: 音频总占用上限，0 表示不限制
+        :param batch_size: 每批扫描 / 删除的条数
+        """
+        self.store = store
+        self.static_dir = static_dir
+        self.retention = timedelta(days=retention_days)
+        self.orphan_grace = orphan_grace_hours * 3600
+        self.quota_bytes = quota_bytes
+        self.batch_size = batch_size
+        self._deleted = set()
+
+    def _delete(self, keys_sizes: dict, report: dict, counter: str, dry_run: bool):
+        if not keys_sizes:
+            return
+        self._deleted.update(keys_sizes)
+        if not dry_run:
+            self.store.backend.delete_many(list(keys_sizes))
+        report[counter] += len(keys_sizes)
+        report["bytes_reclaimed"] += sum(size or 0 for size in keys_sizes.values())
+
+    def _expire_reminder_audio(self, cutoff, report: dict, dry_run: bool):
+        """第一步：按主键分批扫描过期且已听的提醒"""
+        last_id = 0
+        while True:
+            rows = db.session.query(PatientReminder.id, PatientReminder.audio_path).filter(
+                PatientReminder.id > last_id,
+                PatientReminder.created_at < cutoff,
+                PatientReminder.is_listened == True,
+                PatientReminder.audio_path.isnot(None)
+            ).order_by(PatientReminder.id.asc()).limit(self.batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            report["reminders_scanned"] += len(rows)
+
+            urls = set(row[1] for row in rows)
+            candidates = {}
+            for url in urls - _live_urls(urls, cutoff):
+                key = self.store.key_from_url(url)
+                if key:
+                    size = self.store.size(key)
+                    if size is not None:
+                        candidates[key] = size
+                else:
+                    # 迁移前的旧路径（static 根目录）
+                    path = os.path.join(self.static_dir, url.split("/")[-1])
+                    if os.path.isfile(path):
+                        report["bytes_reclaimed"] += os.path.getsize(path)
+                        report["expired_deleted"] += 1
+                        if not dry_run:
+                            os.remove(path)
+            self._delete(candidates, report, "expired_deleted", dry_run)
+
+    def _sweep_store(self, cutoff, report: dict, dry_run: bool) -> tuple:
+        """
+        第二步：遍历存储，删除孤儿文件
+        返回 (可被容量淘汰的候选 [(修改时间, key, 字节数)]，别名文件 key 列表，其他规格音频 key 列表)
+        容量淘汰的候选只包括被过期提醒引用的音频；没有提醒引用、还在宽限期内的音频不在其中
+        """
+        now = time.time()
+        evictable = []
+        aliases = []
+        variants = []
+        batch = []
+
+        def flush():
+            urls = {self.store.url_for(key): (key, size, mtime) for key, size, mtime in batch}
+            referenced = _referenced_urls(urls.keys())
+            live = _live_urls(referenced, cutoff)
+            orphans = {}
+            for url, (key, size, mtime) in urls.items():
+                report["usage_bytes"] += size
+                if url not in referenced:
+                    if now - mtime > self.orphan_grace:
+                        orphans[key] = size
+                elif url not in live:
+                    evictable.append((mtime, key, size))
+            self._delete(orphans, report, "orphans_deleted", dry_run)
+            report["usage_bytes"] -= sum(orphans.values())
+            batch.clear()
+
+        for key, size, mtime in self.store.backend.iter_blobs(self.store.prefix):
+            if self.store.is_alias_key(key):
+                aliases.append(key)
+                continue
+            if self.store.is_variant_key(key):
+                # 其他规格是可重新生成的缓存：计入占用，可被容量淘汰
+                report["usage_bytes"] += size
+                variants.append(key)
+                evictable.append((mtime, key, size))
+                continue
+            if key in self._deleted:
+                continue
+            report["files_scanned"] += 1
+            batch.append((key, size, mtime))
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+        return evictable, aliases, variants
+
+    def _sweep_aliases(self, aliases: list, report: dict, dry_run: bool):
+        """删除指向已删除音频的 TTS 别名（最后执行，包含本次淘汰的音频）"""
+        dangling = []
+        for alias_key in aliases:
+            target = self.store.read_alias(alias_key)
+            if not target or target in self._deleted or not self.store.exists(target):
+                dangling.append(alias_key)
+            if len(dangling) >= self.batch_size:
+                if not dry_run:
+                    self.store.backend.delete_many(dangling)
+                report["aliases_removed"] += len(dangling)
+                dangling = []
+        if dangling and not dry_run:
+            self.store.backend.delete_many(dangling)
+        report["aliases_removed"] += len(dangling)
+
+    def _sweep_variants(self, variants: list, report: dict, dry_run: bool):
+        """删除源音频已不存在的其他规格音频"""
+        stale = {}
+        for key in variants:
+            if key in self._deleted:
+                continue
+            source = self.store.variant_source(key)
+            if source in self._deleted or not self.store.exists(source):
+                stale[key] = self.store.size(key)
+        self._delete(stale, report, "variants_deleted", dry_run)
+        report["usage_bytes"] -= sum(size or 0 for size in stale.values())
+
+    def _sweep_legacy(self, report: dict, dry_run: bool):
+        """static/ 根目录下迁移前遗留、没有提醒引用且超过宽限期的音频和临时文件"""
+        if not os.path.isdir(self.static_dir):
+            return
+        now = time.time()
+        batch = {}
+
+        def flush():
+            referenced = _referenced_urls(batch.keys())
+            for url, (path, size) in batch.items():
+                if url in referenced:
+                    continue
+                report["legacy_deleted"] += 1
+                report["bytes_reclaimed"] += size
+                if not dry_run:
+                    os.remove(path)
+            batch.clear()
+
+        for entry in os.scandir(self.static_dir):
+            if not entry.is_file() or not entry.name.lower().endswith(LEGACY_AUDIO_EXTS):
+                continue
+            st = entry.stat()
+            if now - st.st_mtime <= self.orphan_grace:
+                continue
+            batch[f"/static/{entry.name}"] = (entry.path, st.st_size)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+    def _enforce_quota(self, evictable: list, report: dict, dry_run: bool):
+        """第三步：超出配额时按修改时间从旧到新淘汰"""
+        if not self.quota_bytes or report["usage_bytes"] <= self.quota_bytes:
+            return
+        evictable.sort()
+        victims = {}
+        overflow = report["usage_bytes"] - self.quota_bytes
+        for mtime, key, size in evictable:
+            if overflow <= 0:
+                break
+            victims[key] = size
+            overflow -= size
+            if len(victims) >= self.batch_size:
+                self._delete(victims, report, "evicted", dry_run)
+                victims = {}
+        self._delete(victims, report, "evicted", dry_run)
+        report["usage_bytes"] = self.quota_bytes + overflow
+        if overflow > 0:
+            print(f"音频占用仍超出配额 {overflow} 字节：剩余音频均被有效提醒引用或仍在宽限期内")
+
+    def run(self, dry_run: bool = False) -> dict:
+        started = time.perf_counter()
+        cutoff = datetime.now(timezone.utc) - self.retention
+        report = {
+            "dry_run": dry_run,
+            "reminders_scanned": 0,
+            "files_scanned": 0,
+            "expired_deleted": 0,
+            "orphans_deleted": 0,
+            "aliases_removed": 0,
+            "variants_deleted": 0,
+            "legacy_deleted": 0,
+            "evicted": 0,
+            "bytes_reclaimed": 0,
+            "usage_bytes": 0,
+            "quota_bytes": self.quota_bytes,
+        }
+        self._deleted = set()
+        try:
+            self._expire_reminder_audio(cutoff, report, dry_run)
+            evictable, aliases, variants = self._sweep_store(cutoff, report, dry_run)
+            self._sweep_legacy(report, dry_run)
+            self._enforce_quota(evictable, report, dry_run)
+            self._sweep_aliases(aliases, report, dry_run)
+            self._sweep_variants(variants, report, dry_run)
+        finally:
+            db.session.remove()
+            report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return report
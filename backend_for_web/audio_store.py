@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+音频文件存储（按内容寻址、哈希前缀分目录）
+所有音频按内容的 sha256 命名，key 为 audio/<前2位>/<3-4位>/<sha256>.<ext>（本机存放在 static/ 下）：
+  - 相同内容只保存一份
+  - 单个目录下的文件数有上限（65536 个子目录均摊），目录查找和备份不会随文件数变慢
+  - 不单独维护引用计数：保留策略（audio_retention.py）分批按 patient_reminders.audio_path 查询音频是否仍被引用
+TTS 缓存按文本寻址，合成前并不知道音频内容的哈希，所以额外保存一个“别名”文件：
+audio/_alias/<前2位>/<文本哈希>，内容为对应音频的 key
+"""
+
+import hashlib
+import os
+
+from models import db, PatientReminder
+
+# 分片读取文件计算哈希时的块大小
+HASH_CHUNK_BYTES = 1024 * 1024
+
+CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "pcm": "audio/L16",
+    "ogg": "audio/ogg",
+}
+
+
+class AudioStore:
+    """
+    内容寻址的音频存储，实际读写交给存储后端（blob_backend.py：本机磁盘或 S3 兼容对象存储）
+    key 为相对 static 目录的路径（如 audio/ab/cd/<sha256>.mp3），访问路径为 /static/<key>；
+    对象存储后端时 /static/<key> 重定向到预签名 URL，数据库里保存的访问路径与后端无关
+    """
+
+    def __init__(self, backend, prefix: str = "audio", url_base: str = "/static"):
+        self.backend = backend
+        self.prefix = prefix
+        self.url_base = url_base
+
+    # ---------- key / 路径 ----------
+
+    def key_for(self, digest: str, ext: str) -> str:
+        return f"{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}.{ext.lstrip('.')}"
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_base}/{key}"
+
+    def key_from_url(self, url: str):
+        """/static/audio/... -> audio/...；不是本存储管理的路径返回 None"""
+        if not url:
+            return None
+        head = f"{self.url_base}/{self.prefix}/"
+        if url.startswith(head):
+            return url[len(self.url_base) + 1:]
+        return None
+
+    def exists(self, key: str) -> bool:
+        return self.backend.exists(key)
+
+    def size(self, key: str):
+        return self.backend.size(key)
+
+    # ---------- 写入 / 删除 ----------
+
+    def put_bytes(self, data: bytes, ext: str) -> str:
+        """保存音频内容，返回 key；相同内容已存在时直接复用"""
+        ext = ext.lstrip(".")
+        key = self.key_for(hashlib.sha256(data).hexdigest(), ext)
+        if not self.backend.exists(key):
+            self.backend.put_bytes(key, data, content_type=CONTENT_TYPES.get(ext))
+        return key
+
+    def put_file(self, src_path: str, ext: str = None, move: bool = True) -> str:
+        """把已有文件收进存储（分块计算哈希，不整体读入内存），返回 key"""
+        digest = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        ext = (ext or os.path.splitext(src_path)[1].lstrip(".") or "bin").lstrip(".")
+        key = self.key_for(digest.hexdigest(), ext)
+        if self.backend.exists(key):
+            if move:
+                os.remove(src_path)
+        else:
+            self.backend.put_file(key, src_path, move=move, content_type=CONTENT_TYPES.get(ext))
+        return key
+
+    def delete(self, key: str) -> bool:
+        return self.backend.delete(key)
+
+    def touch(self, key: str):
+        self.backend.touch(key)
+
+    def is_alias_key(self, key: str) -> bool:
+        return key.startswith(f"{self.prefix}/_alias/")
+
+    def is_variant_key(self, key: str) -> bool:
+        """audio_profiles 转码生成的其他规格音频"""
+        return key.startswith(f"{self.prefix}/variants/")
+
+    def variant_source(self, key: str) -> str:
+        """variants/<profile>/<xx>/<sha256>-<profile>.<源扩展名>.<ext> -> 源音频的 key"""
+        stem, source_ext, _ = key.rsplit("/", 1)[-1].split(".", 2)
+        return self.key_for(stem.rsplit("-", 1)[0], source_ext)
+
+    def read_alias(self, alias_key: str):
+        """读取别名文件指向的 key（不检查目标是否存在）"""
+        data = self.backend.get_bytes(alias_key)
+        return data.decode("utf-8").strip() if data else None
+
+    # ---------- 别名（TTS 文本哈希 -> 音频 key） ----------
+
+    def _alias_key(self, name: str) -> str:
+        return f"{self.prefix}/_alias/{name[:2]}/{name}"
+
+    def set_alias(self, name: str, key: str):
+        self.backend.put_bytes(self._alias_key(name), key.encode("utf-8"), content_type="text/plain")
+
+    def resolve_alias(self, name: str):
+        """返回别名指向的 key；别名不存在或音频文件已被清理时返回 None"""
+        data = self.backend.get_bytes(self._alias_key(name))
+        if not data:
+            return None
+        key = data.decode("utf-8").strip()
+        return key if key and self.exists(key) else None
+
+
+# ---------- 旧文件迁移 ----------
+
+def migrate_flat_static(store: AudioStore, static_dir: str, dry_run: bool = False, batch_size: int = 200) -> dict:
+    """
+    把 static/ 根目录下的旧音频迁入分片存储（配置了对象存储时上传到对象存储）：
+      1. patient_reminders 引用的文件：移动到分片目录，并按旧路径批量改写 audio_path（每个旧路径一条 UPDATE）
+      2. tts-<文本哈希>.mp3 旧缓存：移动后写入别名，/api/speak 继续命中
+      3. 清理转码残留的 *.16k.wav / temp_* 临时文件
+    """
+    report = {"moved": 0, "deduplicated": 0, "rows_rewritten": 0, "missing": 0, "tts_aliased": 0, "temp_removed": 0}
+    moved_keys = set()
+
+    old_paths = [row[0] for row in db.session.query(PatientReminder.audio_path).filter(
+        PatientReminder.audio_path.isnot(None),
+        ~PatientReminder.audio_path.like(f"{store.url_base}/{store.prefix}/%")
+    ).distinct().all()]
+
+    pending = 0
+    for old_url in old_paths:
+        relative = old_url[len(store.url_base) + 1:] if old_url.startswith(store.url_base + "/") else old_url.lstrip("/")
+        src_path = os.path.join(static_dir, *relative.split("/"))
+        if not os.path.isfile(src_path):
+            report["missing"] += 1
+            continue
+        if dry_run:
+            report["moved"] += 1
+            continue
+        key = store.put_file(src_path)
+        if key in moved_keys:
+            report["deduplicated"] += 1
+        else:
+            moved_keys.add(key)
+            report["moved"] += 1
+        report["rows_rewritten"] += PatientReminder.query.filter(
+            PatientReminder.audio_path == old_url
+        ).update({"audio_path": store.url_for(key)}, synchronize_session=False)
+        pending += 1
+        if pending >= batch_size:
+            db.session.commit()
+            pending = 0
+    db.session.commit()
+
+    for entry in os.scandir(static_dir):
+        if not entry.is_file():
+            continue
+        name = entry.name
+        if name.startswith("tts-") and "." in name:
+            if not dry_run:
+                text_key = name[len("tts-"):].split(".", 1)[0]
+                store.set_alias(text_key, store.put_file(entry.path))
+            report["tts_aliased"] += 1
+        elif name.endswith(".16k.wav") or name.startswith("temp_"):
+            if not dry_run:
+                os.remove(entry.path)
+            report["temp_removed"] += 1
+
+    return report
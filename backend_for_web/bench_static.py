@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态音频发送性能测试
+对同一个音频分别测：完整下载、带 If-None-Match 的重播（期望 304）、Range 分段请求（拖动进度条），
+输出每种请求的每秒请求数、平均耗时和状态码分布。
+
+用法：
+  python bench_static.py                       # 进程内测试（Flask test client，不需要启动服务）
+  python bench_static.py --url http://127.0.0.1:8000 --path /static/audio/xx/xx/<sha256>.mp3 -c 8
+对比优化前后：在两个版本上分别运行，比较输出的 req/s
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _http_get(url: str, headers: dict):
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            body = resp.read()
+            return resp.status, resp.headers.get("ETag"), len(body)
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), 0
+
+
+def _run(label: str, fetch, total: int, concurrency: int):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(), range(total)))
+    elapsed = time.perf_counter() - started
+    statuses = Counter(r[0] for r in results)
+    transferred = sum(r[2] for r in results)
+    print(f"{label:<16} {total / elapsed:>10.1f} req/s  {elapsed / total * 1000:>8.2f} ms/req  "
+          f"{transferred / 1024 / 1024:>8.2f} MB  状态码 {dict(statuses)}")
+    return results
+
+
+def bench_http(base_url: str, path: str, total: int, concurrency: int):
+    url = base_url.rstrip("/") + path
+    status, etag, size = _http_get(url, {})
+    print(f"测试地址: {url}  首次状态码 {status}  大小 {size} 字节  ETag {etag}")
+    _run("完整下载", lambda: _http_get(url, {}), total, concurrency)
+    if etag:
+        _run("重播(304)", lambda: _http_get(url, {"If-None-Match": etag}), total, concurrency)
+    _run("Range 0-16K", lambda: _http_get(url, {"Range": "bytes=0-16383"}), total, concurrency)
+
+
+def bench_in_process(total: int, audio_kb: int):
+    """在临时目录里创建应用（sqlite 库和 static 目录都在其中），写入一个音频后用 test client 测试，结束后删除"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    work_dir = tempfile.mkdtemp(prefix="bench_static_")
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(work_dir, "bench.db"))
+    os.environ["STATIC_DIR"] = os.path.join(work_dir, "static")
+    from app import create_app
+
+    app = create_app()
+    audio_store = app.extensions["audio_store"]
+    key = audio_store.put_bytes(os.urandom(audio_kb * 1024), "mp3")
+    path = audio_store.url_for(key)
+    client = app.test_client()
+
+    def fetch(headers):
+        resp = client.get(path, headers=headers)
+        return resp.status_code, resp.headers.get("ETag"), len(resp.get_data())
+
+    try:
+        status, etag, size = fetch({})
+        print(f"进程内测试: {path}  首次状态码 {status}  大小 {size} 字节  ETag {etag}")
+        _run("完整下载", lambda: fetch({}), total, 1)
+        if etag:
+            _run("重播(304)", lambda: fetch({"If-None-Match": etag}), total, 1)
+        _run("Range 0-16K", lambda: fetch({"Range": "bytes=0-16383"}), total, 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="静态音频发送性能测试")
+    parser.add_argument("--url", help="服务地址，如 http://127.0.0.1:8000；不填则进程内测试")
+    parser.add_argument("--path", help="要测试的音频路径，如 /static/audio/xx/xx/<sha256>.mp3")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="每种请求的次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="并发数（仅 --url 模式）")
+    parser.add_argument("--audio-kb", type=int, default=200, help="进程内测试时生成的音频大小（KB）")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.path:
+            parser.error("--url 模式需要指定 --path")
+        bench_http(args.url, args.path, args.requests, args.concurrency)
+    else:
+        bench_in_process(args.requests, args.audio_kb)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+音频文件的存储后端
+  - LocalBlobBackend：保存在本机 static/ 目录（单机部署，默认）
+  - S3BlobBackend：保存在 S3 兼容的对象存储（AWS S3 / MinIO / 阿里云 OSS 等），多节点部署时共用
+AudioStore 只负责 key 的命名和别名，读写都通过这里的统一接口；
+对象存储的音频通过预签名 URL（或公共读域名）重定向给客户端，音频字节不经过 Flask
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class LocalBlobBackend:
+    """本机磁盘后端，key 为相对 root_dir 的路径"""
+
+    remote = False
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root_dir, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path_for(key))
+
+    def size(self, key: str):
+        try:
+            return os.path.getsize(self.path_for(key))
+        except OSError:
+            return None
+
+    def _temp_path_for(self, key: str) -> str:
+        final_path = self.path_for(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        return f"{final_path}.{uuid.uuid4().hex}.tmp"
+
+    def put_bytes(self, key: str, data: bytes, content_type: str = None):
+        # 先写临时文件再原子替换，避免其他请求读到写了一半的文件
+        temp_path = self._temp_path_for(key)
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.path_for(key))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put_file(self, key: str, src_path: str, move: bool = True, content_type: str = None):
+        if move:
+            os.makedirs(os.path.dirname(self.path_for(key)), exist_ok=True)
+            os.replace(src_path, self.path_for(key))
+            return
+        temp_path = self._temp_path_for(key)
+        shutil.copyfile(src_path, temp_path)
+        os.replace(temp_path, self.path_for(key))
+
+    def get_bytes(self, key: str):
+        try:
+            with open(self.path_for(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete_many(self, keys) -> int:
+        return sum(1 for key in keys if self.delete(key))
+
+    def touch(self, key: str):
+        """更新修改时间，保留策略按修改时间近似 LRU 淘汰"""
+        try:
+            os.utime(self.path_for(key))
+        except OSError:
+            pass
+
+    def iter_blobs(self, prefix: str):
+        """遍历 prefix 下的所有文件，逐个产出 (key, 字节数, 修改时间戳)"""
+        base = self.path_for(prefix)
+        for dirpath, dirnames, filenames in os.walk(base):
+            rel_dir = os.path.relpath(dirpath, self.root_dir).replace(os.sep, "/")
+            for name in filenames:
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                yield f"{rel_dir}/{name}", st.st_size, st.st_mtime
+
+    def redirect_url(self, key: str):
+        """本地文件由 Flask 直接返回，不需要重定向"""
+        return None
+
+
+class S3BlobBackend:
+    """
+    S3 兼容对象存储后端（需要安装 boto3）
+      - endpoint_url 指向 MinIO 等自建服务；为空时使用 AWS S3
+      - public_base_url 不为空时（桶公共读或前面有 CDN）直接拼接访问地址，否则生成预签名 URL
+      - exists() 的结果在本进程内缓存 exists_ttl 秒，TTS 缓存命中时不用每次都 HEAD 一次
+    """
+
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 access_key: str = None, secret_key: str = None, public_base_url: str = None,
+                 presign_ttl: int = 3600, exists_ttl: int = 60, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("AUDIO_BACKEND=s3 需要安装 boto3：pip install boto3")
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url or None,
+                region_name=region or None,
+                aws_access_key_id=access_key or None,
+                aws_secret_access_key=secret_key or None
+            )
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.public_base_url = (public_base_url or "").rstrip("/") or None
+        self.presign_ttl = presign_ttl
+        self.exists_ttl = exists_ttl
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _remember(self, key: str, size):
+        with self._lock:
+            self._known[key] = (size, time.monotonic() + self.exists_ttl)
+            if len(self._known) > 10000:
+                now = time.monotonic()
+                self._known = {k: v for k, v in self._known.items() if v[1] > now}
+
+    def _head(self, key: str):
+        """返回对象大小，不存在返回 None"""
+        with self._lock:
+            entry = self._known.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        try:
+            size = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))["ContentLength"]
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+        self._remember(key, size)
+        return size
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str):
+        return self._head(key)
+
+    def put_bytes(self, key: str, data: bytes, content_type: str = None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, **extra)
+        self._remember(key, len(data))
+
+    def put_file(self, key: str, src_path: str, move: bool = True, content_type: str = None):
+        size = os.path.getsize(src_path)
+        extra = {"ExtraArgs": {"ContentType": content_type}} if content_type else {}
+        self.client.upload_file(src_path, self.bucket, self._object_key(key), **extra)
+        self._remember(key, size)
+        if move:
+            os.remove(src_path)
+
+    def get_bytes(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"].read()
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self._known.pop(key, None)
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def delete_many(self, keys) -> int:
+        """批量删除（每次请求最多 1000 个对象）"""
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            chunk = keys[start:start + 1000]
+            with self._lock:
+                for key in chunk:
+                    self._known.pop(key, None)
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": self._object_key(key)} for key in chunk],
+                "Quiet": True
+            })
+        return len(keys)
+
+    def touch(self, key: str):
+        """对象存储无法原地更新修改时间，淘汰按上传时间计算"""
+        pass
+
+    def iter_blobs(self, prefix: str):
+        """分页列出 prefix 下的所有对象，逐个产出 (key, 字节数, 修改时间戳)"""
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for item in page.get("Contents", []):
+                yield item["Key"][strip:], item["Size"], item["LastModified"].timestamp()
+
+    def redirect_url(self, key: str):
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self._object_key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=self.presign_ttl
+        )
+
+
+def _is_not_found(error) -> bool:
+    """botocore ClientError 的 404 / NoSuchKey"""
+    response = getattr(error, "response", None) or {}
+    code = str(response.get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+def make_blob_backend(config, static_dir: str):
+    """按配置创建存储后端：AUDIO_BACKEND=local（默认）或 s3"""
+    kind = (config.get("AUDIO_BACKEND") or "local").lower()
+    if kind == "s3":
+        return S3BlobBackend(
+            bucket=config["S3_BUCKET"],
+            prefix=config.get("S3_PREFIX") or "",
+            endpoint_url=config.get("S3_ENDPOINT_URL"),
+            region=config.get("S3_REGION"),
+            access_key=config.get("S3_ACCESS_KEY"),
+            secret_key=config.get("S3_SECRET_KEY"),
+            public_base_url=config.get("S3_PUBLIC_BASE_URL"),
+            presign_ttl=config.get("S3_PRESIGN_TTL", 3600)
+        )
+    return LocalBlobBackend(static_dir)
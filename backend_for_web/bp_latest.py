@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+患者最近一次血压汇总表（bp_latest）的维护
+  - track_bp_latest()：注册 flush 事件，BpRecord 新增时在同一事务里锁住并更新该患者的一行
+    （只和已有的最近一次比较，不扫描历史）；记录被删除、或修改了患者/数值/测量时间时按该患者的历史重算
+  - rebuild_bp_latest()：按患者分批全量重建（上线时回填、数据校正），对应 flask rebuild-bp-latest
+医生首页概览、群发提醒的“最近一次血压异常 / 7 天未测”都直接读这张表，每个患者 O(1)。
+注意：Query.update()/delete() 批量语句不经过 ORM 事件，之后需要重建受影响的患者。
+"""
+
+import json
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, BpRecord, BpLatest
+
+# daily_counts 保留的天数
+COUNT_WINDOW_DAYS = 30
+LATEST_FIELDS = ("record_id", "systolic", "diastolic", "heart_rate", "measured_at")
+# 修改后需要重算的 BpRecord 字段
+_WATCHED_FIELDS = ("user_id", "systolic", "diastolic", "heart_rate", "measured_at")
+
+
+def _naive_utc(value):
+    """数据库里保存的是不带时区的 UTC 时间，新建记录可能带时区，比较前统一"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _is_newer(measured_at, record_id, current: dict) -> bool:
+    """
+    (measured_at, record_id) 是否排在当前最近一次之后
+    与 ORDER BY measured_at DESC, record_id DESC 一致：measured_at 为空的记录排在最后
+    """
+    if not current or current.get("record_id") is None:
+        return True
+    current_at = current.get("measured_at")
+    if (measured_at is None) != (current_at is None):
+        return current_at is None
+    if measured_at is None or measured_at == current_at:
+        return record_id > current["record_id"]
+    return measured_at > current_at
+
+
+def _prune(counts: dict, today) -> dict:
+    oldest = (today - timedelta(days=COUNT_WINDOW_DAYS - 1)).isoformat()
+    return {day: count for day, count in counts.items() if day >= oldest}
+
+
+def _locked_row(connection, user_id):
+    """
+    锁住该患者的汇总行（SELECT ... FOR UPDATE）后返回；还没有时先插入一行空的再锁
+    并发的第一次写入中插入失败（主键冲突）的一方回滚到保存点后改为锁住对方插入的行；
+    同一患者的并发写入因此排队执行，次数不会丢失
+    """
+    table = BpLatest.__table__
+    query = table.select().where(table.c.user_id == user_id).with_for_update()
+    row = connection.execute(query).mappings().first()
+    if row is not None:
+        return row
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(
+                user_id=user_id, daily_counts="{}", total_count=0, updated_at=datetime.now(timezone.utc)
+            ))
+    except IntegrityError:
+        pass
+    return connection.execute(query).mappings().first()
+
+
+def _apply_new_records(connection, records: list):
+    """新增记录：每个患者锁住汇总行后一次 UPDATE"""
+    table = BpLatest.__table__
+    now = datetime.now(timezone.utc)
+    by_user = {}
+    for record in records:
+        by_user.setdefault(record.user_id, []).append(record)
+
+    # 按患者ID顺序加锁，多个患者的批量写入之间不会死锁
+    for user_id, items in sorted(by_user.items()):
+        row = _locked_row(connection, user_id)
+        values = {field: row[field] for field in LATEST_FIELDS} if row["record_id"] is not None else {}
+        counts = json.loads(row["daily_counts"]) if row["daily_counts"] else {}
+        total = row["total_count"] or 0
+
+        for record in items:
+            measured_at = _naive_utc(record.measured_at)
+            if _is_newer(measured_at, record.record_id, values):
+                values = {field: getattr(record, field) for field in LATEST_FIELDS}
+                values["measured_at"] = measured_at
+            if measured_at is not None:
+                day = measured_at.date().isoformat()
+                counts[day] = counts.get(day, 0) + 1
+            total += 1
+
+        values.update(
+            daily_counts=json.dumps(_prune(counts, now.date()), sort_keys=True),
+            total_count=total,
+            updated_at=now
+        )
+        connection.execute(table.update().where(table.c.user_id == user_id).values(**values))
+
+
+def _summaries(connection, user_ids: list) -> dict:
+    """按 bp_records 历史计算这批患者的汇总行（三条查询），没有血压记录的患者不出现在结果里"""
+    records = BpRecord.__table__
+    latest = records.alias("latest_bp")
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    window_start = datetime.combine(today - timedelta(days=COUNT_WINDOW_DAYS - 1), datetime.min.time())
+
+    result = {}
+    for user_id, total in connection.execute(
+        select(records.c.user_id, db.func.count(records.c.record_id))
+        .where(records.c.user_id.in_(user_ids))
+        .group_by(records.c.user_id)
+    ):
+        result[user_id] = {"total_count": total, "daily_counts": {}, "updated_at": now}
+
+    latest_id = select(records.c.record_id).where(
+        records.c.user_id == latest.c.user_id
+    ).order_by(
+        records.c.measured_at.desc(), records.c.record_id.desc()
+    ).limit(1).correlate(latest).scalar_subquery()
+    for row in connection.execute(
+        select(latest.c.user_id, *[latest.c[field] for field in LATEST_FIELDS])
+        .where(latest.c.user_id.in_(user_ids), latest.c.record_id == latest_id)
+    ).mappings():
+        result[row["user_id"]].update({field: row[field] for field in LATEST_FIELDS})
+
+    day_col = db.func.date(records.c.measured_at)
+    for user_id, day, count in connection.execute(
+        select(records.c.user_id, day_col, db.func.count(records.c.record_id))
+        .where(records.c.user_id.in_(user_ids), records.c.measured_at >= window_start)
+        .group_by(records.c.user_id, day_col)
+    ):
+        # SQLite 返回字符串，MySQL 返回 date
+        result[user_id]["daily_counts"][str(day)[:10]] = count
+
+    for values in result.values():
+        values["daily_counts"] = json.dumps(_prune(values["daily_counts"], today), sort_keys=True)
+    return result
+
+
+def _replace_rows(connection, user_ids: list):
+    table = BpLatest.__table__
+    summaries = _summaries(connection, user_ids)
+    connection.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+    if summaries:
+        connection.execute(table.insert(), [dict(user_id=user_id, **values) for user_id, values in summaries.items()])
+
+
+def _after_flush(session, flush_context):
+    added = []
+    recompute = set()
+    for obj in session.new:
+        if isinstance(obj, BpRecord):
+            added.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, BpRecord):
+            recompute.add(obj.user_id)
+    for obj in session.dirty:
+        if not isinstance(obj, BpRecord):
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[field].history.has_changes() for field in _WATCHED_FIELDS):
+            recompute.add(obj.user_id)
+            recompute.update(attrs["user_id"].history.deleted or ())
+
+    recompute.discard(None)
+    added = [record for record in added if record.user_id not in recompute]
+    if not added and not recompute:
+        return
+    connection = session.connection()
+    if added:
+        _apply_new_records(connection, added)
+    if recompute:
+        _replace_rows(connection, sorted(recompute))
+
+
+def track_bp_latest():
+    """注册 flush 事件，BpRecord 的增删改在同一事务里同步到 bp_latest"""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+def rebuild_bp_latest(batch_size: int = 500) -> int:
+    """按患者主键分批重建 bp_latest，每批一个事务，返回有血压记录的患者数"""
+    rebuilt = 0
+    last_id = 0
+    while True:
+        user_ids = [row[0] for row in db.session.query(BpRecord.user_id).filter(
+            BpRecord.user_id > last_id
+        ).distinct().order_by(BpRecord.user_id.asc()).limit(batch_size).all()]
+        # 清理已经没有血压记录的患者（上一批之后、这一批之前的主键区间）
+        upper = user_ids[-1] if user_ids else None
+        stale = BpLatest.query.filter(BpLatest.user_id > last_id)
+        if upper is not None:
+            stale = stale.filter(BpLatest.user_id <= upper, ~BpLatest.user_id.in_(user_ids))
+        stale.delete(synchronize_session=False)
+        if not user_ids:
+            db.session.commit()
+            break
+        _replace_rows(db.session.connection(), user_ids)
+        db.session.commit()
+        rebuilt += len(user_ids)
+        last_id = upper
+    return rebuilt
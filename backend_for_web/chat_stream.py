@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+聊天消息实时推送（Server-Sent Events）
+小程序原来每 3 秒轮询一次 /chat/messages（每次返回整个会话历史），改为打开 /chat/stream 长连接：
+  - 连接时先补发 after_msg_id（或 Last-Event-ID）之后的消息，之后 send_chat_message 提交的新消息直接推送；
+    补发超过 BACKLOG_LIMIT 条时只发一页，接着发送 more 事件并关闭连接，客户端用 /chat/messages?after_msg_id=
+    分页补齐后再重连（否则推送的新消息会让客户端的最后消息ID越过没补发的部分）
+  - 每 CHAT_STREAM_HEARTBEAT 秒发一行注释保活；连接最长 CHAT_STREAM_MAX_SECONDS 秒，客户端带上最后的消息ID重连
+  - 订阅者的队列满了（客户端太慢）直接断开，客户端重连时由补发接上
+多个 worker 之间的分发（CHAT_FANOUT）：
+  - memory：只在本进程内分发（单 worker / 开发）
+  - db：每个 worker 一个线程按主键轮询 chat_messages 的新消息（默认，不需要额外服务）
+  - redis：通过 Redis PUBLISH / SUBSCRIBE 分发（需要安装 redis；也可以注入兼容的客户端，如本地的 fakeredis）
+长连接需要 gunicorn 使用 gevent worker（-k gevent），否则每个连接会占住一个同步 worker。
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from models import db, ChatMessage
+
+# 连接时最多补发的消息条数
+BACKLOG_LIMIT = 200
+
+def conversation_key(patient_id, doctor_id) -> str:
+    return f"{int(patient_id)}:{int(doctor_id)}"
+
+
+class Subscription:
+    """一个 SSE 连接的消息队列"""
+
+    def __init__(self, key: str, queue_size: int):
+        self.key = key
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def get(self, timeout: float):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChatHub:
+    """本进程内按会话分发消息"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.fanout = None
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflowed = 0
+
+    def subscribe(self, key: str) -> Subscription:
+        if self.fanout is not None:
+            self.fanout.ensure_started()
+        subscription = Subscription(key, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, message: dict):
+        """发布一条已提交的消息（经过 fanout 分发到所有 worker）"""
+        if self.fanout is not None:
+            self.fanout.publish(message)
+        else:
+            self.publish_local(message)
+
+    def publish_local(self, message: dict):
+        """分发给本进程内订阅了该会话的连接"""
+        key = conversation_key(message["patient_id"], message["doctor_id"])
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except queue.Full:
+                subscription.overflowed = True
+                self.overflowed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            conversations = len(self._subscribers)
+            connections = sum(len(s) for s in self._subscribers.values())
+        return {
+            "fanout": self.fanout.name if self.fanout else "memory",
+            "conversations": conversations,
+            "connections": connections,
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflowed": self.overflowed,
+        }
+
+
+def _sse_event(message: dict) -> str:
+    # ensure_ascii：整个流只有 ASCII 字符，小程序端按字节拼接即可，不需要 UTF-8 解码
+    return f"id: {message['msg_id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+
+def event_stream(hub: ChatHub, subscription: Subscription, backlog: list,
+                 heartbeat: float = 15, max_seconds: float = 300, more: bool = False):
+    """
+    SSE 响应体：先补发 backlog，再推送订阅到的新消息；同一条消息只发一次
+    more 为 True（补发没有发完）时补发后发送 more 事件（data 为已补发到的消息ID）并结束
+    """
+    sent = set()
+    try:
+        yield "retry: 3000\n\n"
+        for message in backlog:
+            sent.add(message["msg_id"])
+            yield _sse_event(message)
+        if more:
+            yield f"event: more\ndata: {json.dumps({'last_msg_id': backlog[-1]['msg_id']})}\n\n"
+            return
+
+        deadline = time.monotonic() + max_seconds
+        while not subscription.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = subscription.get(timeout=min(heartbeat, remaining))
+            if message is None:
+                yield ": ping\n\n"
+            elif message["msg_id"] not in sent:
+                sent.add(message["msg_id"])
+                yield _sse_event(message)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+class MemoryFanout:
+    """只在本进程内分发"""
+
+    name = "memory"
+
+    def __init__(self, hub: ChatHub):
+        self.hub = hub
+
+    def ensure_started(self):
+        pass
+
+    def publish(self, message: dict):
+        self.hub.publish_local(message)
+
+
+class DbPollFanout:
+    """
+    每个 worker 一个线程，每 interval 秒按主键取 chat_messages 的新消息分发给本进程的订阅者
+    本进程发送的消息也走轮询，保证各 worker 的推送顺序一致；
+    每次回看最近 lookback 个主键，补上主键较小但提交较晚的消息（已分发的按 msg_id 去重）
+    本进程没有订阅者时不查询
+    """
+
+    name = "db"
+
+    def __init__(self, hub: ChatHub, app, interval: float = 1.0, lookback: int = 50, batch_size: int = 500):
+        self.hub = hub
+        self.app = app
+        self.interval = interval
+        self.lookback = lookback
+        self.batch_size = batch_size
+        self._seen = deque(maxlen=2000)
+        self._seen_set = set()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._last_id = None
+        self._wakeup = threading.Event()
+
+    def ensure_started(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                threading.Thread(target=self._run, name="chat-db-fanout", daemon=True).start()
+                self._started = True
+
+    def publish(self, message: dict):
+        # 提交后立即触发一次轮询，本进程的订阅者不用等一个周期
+        self._wakeup.set()
+
+    def _remember(self, msg_id: int) -> bool:
+        if msg_id in self._seen_set:
+            return False
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(msg_id)
+        self._seen_set.add(msg_id)
+        return True
+
+    def poll_once(self):
+        if not self.hub.has_subscribers():
+            self._last_id = None
+            return
+        if self._last_id is None:
+            # 从当前最大主键开始（同样回看 lookback 个，和连接时的补发重叠的部分由 event_stream 去重）
+            self._last_id = db.session.query(db.func.max(ChatMessage.msg_id)).scalar() or 0
+        rows = ChatMessage.query.options(
+            db.joinedload(ChatMessage.patient), db.joinedload(ChatMessage.doctor)
+        ).filter(
+            ChatMessage.msg_id > self._last_id - self.lookback
+        ).order_by(ChatMessage.msg_id.asc()).limit(self.batch_size).all()
+        for row in rows:
+            self._last_id = max(self._last_id, row.msg_id)
+            if self._remember(row.msg_id):
+                self.hub.publish_local(row.to_dict())
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    print(f"聊天消息轮询失败: {e}")
+                finally:
+                    db.session.remove()
+
+
+class RedisFanout:
+    """通过 Redis 频道在各 worker 之间分发（需要安装 redis，或传入兼容的 client）"""
+
+    name = "redis"
+
+    def __init__(self, hub: ChatHub, url: str = None, channel: str = "chat_messages", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CHAT_FANOUT=redis 需要安装 redis：pip install redis")
+            client = redis.Redis.from_url(url or "redis://127.0.0.1:6379/0")
+        self.hub = hub
+        self.client = client
+        self.channel = channel
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def ensure_started(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                threading.Thread(target=self._run, name="chat-redis-fanout", daemon=True).start()
+                self._started = True
+        # 等订阅建立后再返回，避免刚连上的客户端错过紧接着发布的消息
+        self._ready.wait(5)
+
+    def publish(self, message: dict):
+        try:
+            self.client.publish(self.channel, json.dumps(message))
+        except Exception as e:
+            # Redis 不可用时至少推送给本进程的订阅者，其他 worker 的客户端重连时由补发接上
+            print(f"发布聊天消息到 Redis 失败: {e}")
+            self.hub.publish_local(message)
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._ready.set()
+                for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    data = item["data"]
+                    self.hub.publish_local(json.loads(data.decode("utf-8") if isinstance(data, bytes) else data))
+            except Exception as e:
+                print(f"Redis 订阅中断，稍后重连: {e}")
+                time.sleep(1)
+
+
+def make_chat_fanout(config, hub: ChatHub, app):
+    """按配置创建分发方式：CHAT_FANOUT=db（默认）/ memory / redis"""
+    kind = (config.get("CHAT_FANOUT") or "db").lower()
+    if kind == "memory":
+        return MemoryFanout(hub)
+    if kind == "redis":
+        return RedisFanout(hub, url=config.get("CHAT_REDIS_URL"), channel=config.get("CHAT_REDIS_CHANNEL") or "chat_messages")
+    return DbPollFanout(hub, app, interval=config.get("CHAT_POLL_INTERVAL", 1.0))
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+会话摘要表（conversation_summaries）的维护和收件箱查询
+消息列表页原来对每个会话各调一次 /chat/last_message（ORDER BY）和 /chat/unread_count（COUNT），
+改为每对 (患者, 医生) 保存一行摘要：最后一条消息的 ID / 预览 / 时间，以及双方各自的未读数。
+  - message_sent()：send_chat_message 提交前调用，在同一事务里更新最后一条消息并给接收方未读数 +1
+  - messages_read()：mark_messages_read 批量标记后调用，按实际标记的条数减少读取方的未读数
+  - rebuild_conversations()：按 chat_messages 全量重建（上线时回填、数据校正），对应 flask rebuild-conversations
+  - inbox()：/chat/inbox 一次查询取出医生（或患者）在本村的所有会话，按最近消息排序
+未读数用 UPDATE ... SET x = x + 1 在数据库里累加，并发发送不会互相覆盖。
+注意：直接写 chat_messages 的批量语句不会更新摘要，之后需要重建。
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Patient, Doctor, ChatMessage, ConversationSummary
+
+# 预览保留的字符数（列宽 200）
+PREVIEW_LENGTH = 100
+# 读取方 -> 对应的未读数字段；sender_type 是谁发的，对方的未读数 +1
+UNREAD_FIELDS = {"patient": "patient_unread", "doctor": "doctor_unread"}
+RECEIVER = {"patient": "doctor", "doctor": "patient"}
+
+
+def _preview(content) -> str:
+    content = (content or "").strip()
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + "…"
+    return content
+
+
+def _conversation(table, patient_id, doctor_id):
+    return (table.c.patient_id == patient_id) & (table.c.doctor_id == doctor_id)
+
+
+def _ensure_row(connection, patient_id, doctor_id):
+    """会话还没有摘要行时插入一行（并发插入时主键冲突的一方忽略）"""
+    table = ConversationSummary.__table__
+    exists = connection.execute(
+        select(table.c.patient_id).where(_conversation(table, patient_id, doctor_id))
+    ).first()
+    if exists:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(
+                patient_id=patient_id,
+                doctor_id=doctor_id,
+                patient_unread=0,
+                doctor_unread=0,
+                updated_at=datetime.now(timezone.utc)
+            ))
+    except IntegrityError:
+        pass
+
+
+def message_sent(message: ChatMessage):
+    """新消息已 flush（有 msg_id）、尚未提交时调用，摘要和消息在同一事务里提交"""
+    table = ConversationSummary.__table__
+    connection = db.session.connection()
+    where = _conversation(table, message.patient_id, message.doctor_id)
+    _ensure_row(connection, message.patient_id, message.doctor_id)
+
+    unread = UNREAD_FIELDS[RECEIVER[message.sender_type]]
+    connection.execute(table.update().where(where).values(
+        **{unread: table.c[unread] + 1},
+        updated_at=datetime.now(timezone.utc)
+    ))
+    # 只在比当前最后一条更新时替换，先提交的较小主键不会覆盖较大的
+    connection.execute(table.update().where(
+        where, (table.c.last_msg_id.is_(None)) | (table.c.last_msg_id < message.msg_id)
+    ).values(
+        last_msg_id=message.msg_id,
+        last_sender_type=message.sender_type,
+        last_preview=_preview(message.content),
+        last_message_at=message.created_at
+    ))
+
+
+def _unread_counts(connection, pairs: list) -> dict:
+    """按 chat_messages 统计这些会话双方的未读数：{(patient_id, doctor_id): {"patient_unread", "doctor_unread"}}"""
+    messages = ChatMessage.__table__
+    counts = {pair: {"patient_unread": 0, "doctor_unread": 0} for pair in pairs}
+    for patient_id, doctor_id, sender_type, count in connection.execute(
+        select(messages.c.patient_id, messages.c.doctor_id, messages.c.sender_type, db.func.count(messages.c.msg_id))
+        .where(
+            db.tuple_(messages.c.patient_id, messages.c.doctor_id).in_(pairs),
+            messages.c.is_read == False
+        )
+        .group_by(messages.c.patient_id, messages.c.doctor_id, messages.c.sender_type)
+    ):
+        receiver = RECEIVER.get(sender_type)
+        if receiver:
+            counts[(patient_id, doctor_id)][UNREAD_FIELDS[receiver]] += count
+    return counts
+
+
+def messages_read(patient_id, doctor_id, reader_type: str, count: int):
+    """reader_type 一方把 count 条消息标记为已读后调用；reader_type 不是 patient/doctor 时按消息表重算"""
+    if not count:
+        return
+    table = ConversationSummary.__table__
+    connection = db.session.connection()
+    where = _conversation(table, patient_id, doctor_id)
+    field = UNREAD_FIELDS.get(reader_type)
+    if field is None:
+        values = _unread_counts(connection, [(patient_id, doctor_id)])[(patient_id, doctor_id)]
+    else:
+        column = table.c[field]
+        values = {field: db.case((column > count, column - count), else_=0)}
+    connection.execute(table.update().where(where).values(**values, updated_at=datetime.now(timezone.utc)))
+
+
+def _replace_rows(connection, pairs: list):
+    """按 chat_messages 重算这些会话的摘要行（两条查询）"""
+    table = ConversationSummary.__table__
+    messages = ChatMessage.__table__
+    now = datetime.now(timezone.utc)
+
+    last_ids = select(db.func.max(messages.c.msg_id)).where(
+        db.tuple_(messages.c.patient_id, messages.c.doctor_id).in_(pairs)
+    ).group_by(messages.c.patient_id, messages.c.doctor_id)
+    counts = _unread_counts(connection, pairs)
+    rows = []
+    for row in connection.execute(
+        select(messages).where(messages.c.msg_id.in_(last_ids))
+    ).mappings():
+        rows.append(dict(
+            patient_id=row["patient_id"],
+            doctor_id=row["doctor_id"],
+            last_msg_id=row["msg_id"],
+            last_sender_type=row["sender_type"],
+            last_preview=_preview(row["content"]),
+            last_message_at=row["created_at"],
+            updated_at=now,
+            **counts[(row["patient_id"], row["doctor_id"])]
+        ))
+
+    connection.execute(table.delete().where(db.tuple_(table.c.patient_id, table.c.doctor_id).in_(pairs)))
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def rebuild_conversations(batch_size: int = 500) -> int:
+    """按会话分批重建摘要，每批一个事务，最后删除已经没有消息的会话，返回有消息的会话数"""
+    rebuilt = 0
+    last_pair = None
+    while True:
+        query = db.session.query(ChatMessage.patient_id, ChatMessage.doctor_id).distinct()
+        if last_pair is not None:
+            query = query.filter(db.tuple_(ChatMessage.patient_id, ChatMessage.doctor_id) > last_pair)
+        pairs = [tuple(row) for row in query.order_by(
+            ChatMessage.patient_id.asc(), ChatMessage.doctor_id.asc()
+        ).limit(batch_size).all()]
+        if not pairs:
+            break
+        _replace_rows(db.session.connection(), pairs)
+        db.session.commit()
+        rebuilt += len(pairs)
+        last_pair = pairs[-1]
+
+    has_messages = db.session.query(ChatMessage.msg_id).filter(
+        ChatMessage.patient_id == ConversationSummary.patient_id,
+        ChatMessage.doctor_id == ConversationSummary.doctor_id
+    ).exists()
+    ConversationSummary.query.filter(~has_messages).delete(synchronize_session=False)
+    db.session.commit()
+    return rebuilt
+
+
+def _recency_order(summary):
+    # 有消息的会话按最后一条消息排在前面（主键越大越新），没有消息的排在最后
+    return (db.case((summary.last_msg_id.is_(None), 1), else_=0), summary.last_msg_id.desc())
+
+
+def inbox(doctor: Doctor = None, patient: Patient = None) -> list:
+    """
+    医生（或患者）的收件箱：本村的每个患者（或医生）一项，一次查询
+    返回 [{...对方 to_dict(), "last_message": {...} 或 None, "unread_count": 本方未读数}]
+    """
+    summary = ConversationSummary
+    if doctor is not None:
+        rows = db.session.query(Patient, summary).outerjoin(summary, db.and_(
+            summary.patient_id == Patient.user_id, summary.doctor_id == doctor.worker_id
+        )).filter(Patient.village == doctor.village).order_by(
+            *_recency_order(summary), Patient.name.asc(), Patient.user_id.asc()
+        ).all()
+        unread = "doctor_unread"
+    else:
+        rows = db.session.query(Doctor, summary).outerjoin(summary, db.and_(
+            summary.doctor_id == Doctor.worker_id, summary.patient_id == patient.user_id
+        )).filter(Doctor.village == patient.village).order_by(
+            *_recency_order(summary), Doctor.name.asc(), Doctor.worker_id.asc()
+        ).all()
+        unread = "patient_unread"
+
+    conversations = []
+    for counterpart, row in rows:
+        item = counterpart.to_dict()
+        item["last_message"] = row.last_message_dict() if row else None
+        item["unread_count"] = getattr(row, unread) if row else 0
+        conversations.append(item)
+    return conversations
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+医生首页 / 患者管理页的村内患者概览
+原来小程序先取患者列表，再对每个患者请求一次完整的血压历史（200 个患者 = 201 次请求），
+这里用一条 SQL（patients LEFT JOIN bp_latest）同时取出每个患者的最近一次血压、
+近 7 天 / 30 天测量次数和异常标记；bp_latest 由 bp_latest.py 在写入血压时同步维护。
+"""
+
+from datetime import datetime, timezone
+
+from models import db, Patient, BpLatest
+
+# 血压异常阈值（与群发提醒的“最近一次血压异常”一致）
+SYSTOLIC_HIGH = 140
+SYSTOLIC_LOW = 90
+DIASTOLIC_HIGH = 90
+DIASTOLIC_LOW = 60
+
+
+def abnormal_bp_clause(model):
+    """血压异常的 SQL 条件，model 为 BpRecord 或具有 systolic / diastolic 列的别名、子查询"""
+    return db.or_(
+        model.systolic >= SYSTOLIC_HIGH,
+        model.systolic <= SYSTOLIC_LOW,
+        model.diastolic >= DIASTOLIC_HIGH,
+        model.diastolic <= DIASTOLIC_LOW
+    )
+
+
+def is_abnormal_bp(systolic, diastolic) -> bool:
+    if systolic is None or diastolic is None:
+        return False
+    return (systolic >= SYSTOLIC_HIGH or systolic <= SYSTOLIC_LOW
+            or diastolic >= DIASTOLIC_HIGH or diastolic <= DIASTOLIC_LOW)
+
+
+def doctor_dashboard(village: str) -> dict:
+    """
+    村内全部患者及其最近一次血压、近 7/30 天测量次数（按自然日）、异常标记（一条 SQL）
+    :return: {"patients": [...], "summary": {...}}
+    """
+    rows = db.session.query(Patient, BpLatest).outerjoin(
+        BpLatest, BpLatest.user_id == Patient.user_id
+    ).filter(
+        Patient.village == village
+    ).order_by(Patient.name.asc(), Patient.user_id.asc()).all()
+
+    today = datetime.now(timezone.utc).date()
+    patients = []
+    summary = {"patient_count": 0, "abnormal_count": 0, "no_record_7d_count": 0, "never_measured_count": 0}
+    for patient, latest in rows:
+        count_7d, count_30d = latest.recent_counts(today) if latest else (0, 0)
+        abnormal = bool(latest) and is_abnormal_bp(latest.systolic, latest.diastolic)
+        item = patient.to_dict()
+        item.update({
+            "latest_bp": {
+                "record_id": latest.record_id,
+                "systolic": latest.systolic,
+                "diastolic": latest.diastolic,
+                "heart_rate": latest.heart_rate,
+                "measured_at": latest.measured_at.isoformat() if latest.measured_at else None
+            } if latest else None,
+            "bp_count_7d": count_7d,
+            "bp_count_30d": count_30d,
+            "abnormal": abnormal
+        })
+        patients.append(item)
+
+        summary["patient_count"] += 1
+        summary["abnormal_count"] += 1 if abnormal else 0
+        summary["no_record_7d_count"] += 0 if count_7d else 1
+        summary["never_measured_count"] += 0 if latest else 1
+    return {"patients": patients, "summary": summary}
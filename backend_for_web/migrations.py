@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+数据库结构版本管理
+表结构原来只靠 db.create_all() 创建：已有的表不会补建新增的索引，新增的表要等有人手动建。
+这里按版本号依次执行迁移，已执行的版本记录在 schema_version 表中：
+    flask db-upgrade      执行所有未执行的迁移
+    flask db-version      查看当前版本和待执行的迁移
+新增迁移时在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号只增不改；
+每个迁移都要能重复执行（建索引前先检查是否存在），中途失败后重新执行即可。
+新增的索引同时写进模型的 __table_args__，新建的库由 create_all 直接创建。
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, text
+
+from models import db
+
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("description", db.String(255)),
+    db.Column("applied_at", db.DateTime)
+)
+
+
+def _create_missing_tables(connection):
+    """补建模型中新增的表（reminder_jobs、bp_latest 等），已有的表不变"""
+    db.metadata.create_all(bind=connection)
+
+
+def _create_indexes(*names):
+    """按名称创建模型 __table_args__ 中声明、数据库里还没有的索引"""
+    def migrate(connection):
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            wanted = [index for index in table.indexes if index.name in names]
+            if not wanted:
+                continue
+            existing = set(index["name"] for index in inspector.get_indexes(table.name))
+            for index in wanted:
+                if index.name not in existing:
+                    print(f"  创建索引 {table.name}.{index.name}")
+                    index.create(bind=connection)
+    return migrate
+
+
+def _add_columns(table_name: str, *names):
+    """按模型定义补加已有表中缺少的列（只支持可为空的列）"""
+    def migrate(connection):
+        table = db.metadata.tables[table_name]
+        existing = set(column["name"] for column in inspect(connection).get_columns(table_name))
+        for name in names:
+            if name not in existing:
+                column_type = table.c[name].type.compile(dialect=connection.dialect)
+                print(f"  添加列 {table_name}.{name}")
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+    return migrate
+
+
+def _drop_indexes(table_name: str, *names):
+    def migrate(connection):
+        existing = set(index["name"] for index in inspect(connection).get_indexes(table_name))
+        for name in names:
+            if name in existing:
+                print(f"  删除索引 {table_name}.{name}")
+                # 用独立的 MetaData 构造索引对象，不改动模型的元数据
+                detached = db.Table(table_name, db.MetaData(), db.Column("id", db.Integer))
+                db.Index(name, detached.c.id).drop(bind=connection)
+    return migrate
+
+
+def _unique_patient_reminders(connection):
+    """删除重复的 (doctor_reminder_id, patient_id) 记录（保留最早的一条），再建唯一索引、删掉原来的普通索引"""
+    result = connection.execute(text(
+        "DELETE FROM patient_reminders WHERE id NOT IN ("
+        " SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM patient_reminders"
+        " GROUP BY doctor_reminder_id, patient_id) AS keep)"
+    ))
+    if result.rowcount:
+        print(f"  删除重复的患者提醒 {result.rowcount} 条")
+    _create_indexes("uq_patient_reminders_reminder_patient")(connection)
+    _drop_indexes("patient_reminders", "ix_patient_reminders_reminder_patient")(connection)
+
+
+def _fill_null_created_at(*table_names):
+    """created_at 改为 NOT NULL 前把旧数据里的空值填成 1970-01-01（与原来 NULL 的排序位置一致：倒序排在最后）"""
+    def migrate(connection):
+        for table_name in table_names:
+            table = db.metadata.tables[table_name]
+            result = connection.execute(
+                table.update().where(table.c.created_at.is_(None)).values(created_at=datetime(1970, 1, 1))
+            )
+            if result.rowcount:
+                print(f"  {table_name}.created_at 填充空值 {result.rowcount} 行")
+    return migrate
+
+
+def _drop_tables(*names):
+    """删除模型中已经去掉的表（不存在时跳过）"""
+    def migrate(connection):
+        existing = set(inspect(connection).get_table_names())
+        for name in names:
+            if name in existing:
+                print(f"  删除表 {name}")
+                # 用独立的 MetaData 构造表对象，不改动模型的元数据
+                db.Table(name, db.MetaData()).drop(bind=connection)
+    return migrate
+
+
+def _backfill_bp_latest(connection):
+    from bp_latest import rebuild_bp_latest
+    print(f"  已回填 bp_latest：{rebuild_bp_latest()} 个患者")
+
+
+def _backfill_conversations(connection):
+    from conversations import rebuild_conversations
+    _create_missing_tables(connection)
+    print(f"  已回填 conversation_summaries：{rebuild_conversations()} 个会话")
+
+
+MIGRATIONS = [
+    (1, "补建新增的表", _create_missing_tables),
+    (2, "热点查询的复合索引", _create_indexes(
+        "ix_patients_village_name",
+        "ix_bp_records_user_measured",
+        "ix_medicine_user_start",
+        "ix_doc_msg_user_created",
+        "ix_reminder_user_created",
+        "ix_reminder_jobs_status_heartbeat",
+        "ix_patient_reminders_patient_created",
+        "ix_chat_messages_conversation",
+        "ix_chat_messages_unread",
+    )),
+    (3, "回填每个患者的最近一次血压", _backfill_bp_latest),
+    (4, "聊天消息按主键增量同步的索引", _create_indexes("ix_chat_messages_conversation_id")),
+    (5, "会话摘要表并回填", _backfill_conversations),
+    (6, "群发任务认领令牌", _add_columns("reminder_jobs", "claim_token")),
+    (7, "患者提醒 (医生提醒, 患者) 唯一", _unique_patient_reminders),
+    (8, "定时提醒按修改时间增量同步的索引", _create_indexes("ix_reminder_updated_at")),
+    (9, "分页排序列 created_at 填充空值", _fill_null_created_at("doc_msg", "reminder", "doctor_reminders")),
+    (10, "删除不再使用的音频引用计数表", _drop_tables("audio_blobs")),
+]
+
+
+def current_version() -> int:
+    schema_version.create(bind=db.engine, checkfirst=True)
+    version = db.session.query(db.func.max(schema_version.c.version)).scalar()
+    db.session.commit()
+    return version or 0
+
+
+def pending_migrations() -> list:
+    version = current_version()
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def upgrade(target: int = None) -> list:
+    """依次执行未执行的迁移（最多到 target 版本），每个迁移一个事务，返回执行过的版本号"""
+    applied = []
+    for version, description, migrate in pending_migrations():
+        if target is not None and version > target:
+            break
+        print(f"执行迁移 {version}: {description}")
+        try:
+            migrate(db.session.connection())
+            db.session.execute(schema_version.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.now(timezone.utc)
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -1,4 +1,5 @@
 
+import json
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone, date, time, timedelta
 from enum import Enum
@@ -29,6 +30,9 @@ class ChannelEnum(Enum):
 class Patient(db.Model):
     """患者信息表"""
     __tablename__ = 'patients'
+    __table_args__ = (
+        db.Index('ix_patients_village_name', 'village', 'name', 'user_id'),
+    )
     
     user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(100))
@@ -99,6 +103,9 @@ class Doctor(db.Model):
 class BpRecord(db.Model):
     """血压信息记录表"""
     __tablename__ = 'bp_records'
+    __table_args__ = (
+        db.Index('ix_bp_records_user_measured', 'user_id', 'measured_at', 'record_id'),
+    )
     
     record_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), nullable=False, index=True)
@@ -127,9 +134,56 @@ class BpRecord(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
 
+class BpLatest(db.Model):
+    """
+    每个患者的最近一次血压和近期测量次数（由 bp_latest.py 在写入 BpRecord 的同一事务中维护）
+    daily_counts 为近 30 天每天的测量次数 JSON：{"YYYY-MM-DD": 次数}
+    """
+    __tablename__ = 'bp_latest'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), primary_key=True)
+    record_id = db.Column(db.Integer)
+    systolic = db.Column(db.Integer)
+    diastolic = db.Column(db.Integer)
+    heart_rate = db.Column(db.Integer)
+    measured_at = db.Column(db.DateTime, index=True)
+    daily_counts = db.Column(db.Text)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def recent_counts(self, today: date = None) -> tuple:
+        """返回 (近 7 天测量次数, 近 30 天测量次数)，按自然日计算（含今天）"""
+        today = today or datetime.now(timezone.utc).date()
+        counts_7d = counts_30d = 0
+        for day, count in (json.loads(self.daily_counts) if self.daily_counts else {}).items():
+            age = (today - date.fromisoformat(day)).days
+            if 0 <= age < 30:
+                counts_30d += count
+                if age < 7:
+                    counts_7d += count
+        return counts_7d, counts_30d
+
+    def to_dict(self):
+        count_7d, count_30d = self.recent_counts()
+        return {
+            "user_id": self.user_id,
+            "record_id": self.record_id,
+            "systolic": self.systolic,
+            "diastolic": self.diastolic,
+            "heart_rate": self.heart_rate,
+            "measured_at": self.measured_at.isoformat() if self.measured_at else None,
+            "count_7d": count_7d,
+            "count_30d": count_30d,
+            "total_count": self.total_count,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
 class Medicine(db.Model):
     """用药记录表"""
     __tablename__ = 'medicine'
+    __table_args__ = (
+        db.Index('ix_medicine_user_start', 'user_id', 'start_date', 'med_id'),
+    )
     
     med_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), nullable=False, index=True)
@@ -159,6 +213,9 @@ class Medicine(db.Model):
 class DocMsg(db.Model):
     """村医留言表"""
     __tablename__ = 'doc_msg'
+    __table_args__ = (
+        db.Index('ix_doc_msg_user_created', 'user_id', 'created_at', 'msg_id'),
+    )
     
     msg_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), nullable=False, index=True)
@@ -173,7 +230,7 @@ class DocMsg(db.Model):
     reply_by = db.Column(db.Integer, db.ForeignKey('doctors.worker_id', ondelete='SET NULL'))
     reply_at = db.Column(db.DateTime)
     urgent = db.Column(db.Boolean, default=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
     updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
 
     def to_dict(self):
@@ -198,6 +255,10 @@ class DocMsg(db.Model):
 class Reminder(db.Model):
     """提醒表"""
     __tablename__ = 'reminder'
+    __table_args__ = (
+        db.Index('ix_reminder_user_created', 'user_id', 'created_at', 'plan_id'),
+        db.Index('ix_reminder_updated_at', 'updated_at'),
+    )
     
     plan_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), nullable=False, index=True)
@@ -209,8 +270,9 @@ class Reminder(db.Model):
     weekdays = db.Column(db.String(20))
     channel = db.Column(db.Enum(ChannelEnum), default=ChannelEnum.APP_PUSH)
     enabled = db.Column(db.Boolean, default=True, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # 派发进程按 updated_at 增量同步其他 worker 的修改，默认值必须在每次写入时取当前时间
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
     def to_dict(self):
         return {
@@ -236,7 +298,7 @@ class DoctorReminder(db.Model):
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.worker_id', ondelete='CASCADE'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
     target_type = db.Column(db.String(20), nullable=False)  # 'all', 'noRecord', 'abnormal'
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
     
     # 关系
     doctor = db.relationship("Doctor", backref="reminders_sent", lazy=True)
@@ -252,9 +314,58 @@ class DoctorReminder(db.Model):
             "doctor_name": self.doctor.name if self.doctor else None
         }
 
+class ReminderJob(db.Model):
+    """提醒群发任务表（后台逐批为患者生成提醒，重启后可续跑）"""
+    __tablename__ = 'reminder_jobs'
+    __table_args__ = (
+        db.Index('ix_reminder_jobs_status_heartbeat', 'status', 'heartbeat_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    doctor_reminder_id = db.Column(db.Integer, db.ForeignKey('doctor_reminders.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'succeeded', 'failed'
+    target_ids = db.Column(db.Text)  # 目标患者ID快照（JSON数组），续跑时沿用同一批患者
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)  # 每个患者的失败原因（JSON数组）
+    heartbeat_at = db.Column(db.DateTime, index=True)
+    claim_token = db.Column(db.String(32))  # 当前执行者的令牌，写入进度时校验，防止重新认领后两个进程同时执行
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    finished_at = db.Column(db.DateTime)
+
+    doctor_reminder = db.relationship("DoctorReminder", backref="jobs", lazy=True)
+
+    def to_dict(self):
+        try:
+            errors = json.loads(self.errors) if self.errors else []
+        except ValueError:
+            errors = []
+        total = self.total or 0
+        processed = self.processed or 0
+        return {
+            "job_id": self.id,
+            "doctor_reminder_id": self.doctor_reminder_id,
+            "status": self.status,
+            "total": total,
+            "processed": processed,
+            "progress": round(processed / total, 4) if total else (1.0 if self.status == 'succeeded' else 0.0),
+            "success_count": self.success_count or 0,
+            "failed_count": self.failed_count or 0,
+            "errors": errors,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
 class PatientReminder(db.Model):
     """患者提醒表"""
     __tablename__ = 'patient_reminders'
+    __table_args__ = (
+        db.Index('ix_patient_reminders_patient_created', 'patient_id', 'created_at', 'id'),
+        # 同一条医生提醒对同一患者只写一次（群发任务续跑 / 重复认领时兜底）
+        db.Index('uq_patient_reminders_reminder_patient', 'doctor_reminder_id', 'patient_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     doctor_reminder_id = db.Column(db.Integer, db.ForeignKey('doctor_reminders.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -262,7 +373,7 @@ class PatientReminder(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), name='patient_id', nullable=False, index=True)
     is_listened = db.Column(db.Boolean, default=False, index=True)
     audio_path = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     
     # 关系，使用延迟加载和连接加载优化
     patient = db.relationship("Patient", 
@@ -339,6 +450,11 @@ class PatientReminder(db.Model):
 class ChatMessage(db.Model):
     """聊天消息表"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_conversation', 'patient_id', 'doctor_id', 'created_at', 'msg_id'),
+        db.Index('ix_chat_messages_unread', 'patient_id', 'doctor_id', 'is_read', 'sender_type'),
+        db.Index('ix_chat_messages_conversation_id', 'patient_id', 'doctor_id', 'msg_id'),
+    )
     
     msg_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), nullable=False, index=True)
@@ -346,13 +462,14 @@ class ChatMessage(db.Model):
     sender_type = db.Column(db.String(20), nullable=False)  # 'patient' or 'doctor'
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     
     # 关系
     patient = db.relationship("Patient", backref="chat_messages", lazy=True)
     doctor = db.relationship("Doctor", backref="chat_messages", lazy=True)
 
-    def to_dict(self):
+    def to_dict(self, names: tuple = None):
+        """names 为 (患者姓名, 医生姓名)：序列化同一会话的多条消息时传入，避免逐条懒加载 patient / doctor"""
         return {
             "msg_id": self.msg_id,
             "patient_id": self.patient_id,
@@ -361,8 +478,49 @@ class ChatMessage(db.Model):
             "content": self.content,
             "is_read": self.is_read,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "patient_name": self.patient.name if self.patient else None,
-            "doctor_name": self.doctor.name if self.doctor else None
+            "patient_name": names[0] if names else (self.patient.name if self.patient else None),
+            "doctor_name": names[1] if names else (self.doctor.name if self.doctor else None)
+        }
+
+class ConversationSummary(db.Model):
+    """
+    会话摘要表：每对 (患者, 医生) 一行，保存最后一条消息和双方的未读数
+    由 conversations.py 在发送消息、标记已读的同一事务中更新，消息列表页一次查询取出
+    """
+    __tablename__ = 'conversation_summaries'
+    __table_args__ = (
+        # 患者一侧按主键前缀 patient_id 查找
+        db.Index('ix_conversation_summaries_doctor_last', 'doctor_id', 'last_msg_id'),
+    )
+
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.user_id', ondelete='CASCADE'), primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.worker_id', ondelete='CASCADE'), primary_key=True)
+    last_msg_id = db.Column(db.Integer)
+    last_sender_type = db.Column(db.String(20))
+    last_preview = db.Column(db.String(200))
+    last_message_at = db.Column(db.DateTime)
+    patient_unread = db.Column(db.Integer, nullable=False, default=0)  # 医生发送、患者未读
+    doctor_unread = db.Column(db.Integer, nullable=False, default=0)   # 患者发送、医生未读
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def last_message_dict(self):
+        if self.last_msg_id is None:
+            return None
+        return {
+            "msg_id": self.last_msg_id,
+            "sender_type": self.last_sender_type,
+            "content": self.last_preview,
+            "created_at": self.last_message_at.isoformat() if self.last_message_at else None
+        }
+
+    def to_dict(self):
+        return {
+            "patient_id": self.patient_id,
+            "doctor_id": self.doctor_id,
+            "last_message": self.last_message_dict(),
+            "patient_unread": self.patient_unread,
+            "doctor_unread": self.doctor_unread,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
 
 class BpAnalysis(db.Model):
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+游标（keyset）分页
+列表接口按 (排序列, 主键) 排序，客户端传上一页返回的 next_cursor 取下一页：
+  WHERE (排序列, 主键) < (上一页最后一条的值) ORDER BY 排序列 DESC, 主键 DESC LIMIT limit + 1
+无论翻到第几页都只走索引定位，开销恒定；多取一条判断是否还有下一页，不需要 COUNT。
+排序列允许为 NULL（MySQL / SQLite 中 NULL 最小：升序排在最前，降序排在最后）；
+只有模型里可为空的排序列才加 “OR 排序列 IS NULL” 条件，NOT NULL 列保持单纯的索引范围扫描。
+
+用法：
+    args = pagination_args()
+    if args:
+        items, next_cursor = keyset_page(query, BpRecord.measured_at, BpRecord.record_id, *args)
+"""
+
+import base64
+import json
+from datetime import datetime, date
+
+from flask import request
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class CursorError(ValueError):
+    """游标格式错误或与当前接口不匹配"""
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(value, column):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_dump_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise CursorError("游标与接口不匹配")
+        return [_load_value(v, c) for v, c in zip(values, columns)]
+    except CursorError:
+        raise
+    except Exception as e:
+        raise CursorError(f"无效的游标: {e}")
+
+
+def pagination_args(default_limit: int = DEFAULT_PAGE_SIZE):
+    """
+    读取 limit / cursor 参数
+    两者都没传时返回 None（接口保持原来的不分页返回，兼容旧版小程序），否则返回 (limit, cursor)
+    """
+    if "limit" not in request.args and "cursor" not in request.args:
+        return None
+    limit = request.args.get("limit", default_limit, type=int) or default_limit
+    return max(1, min(limit, MAX_PAGE_SIZE)), request.args.get("cursor") or None
+
+
+def _nullable(column) -> bool:
+    return getattr(getattr(column, "expression", column), "nullable", True)
+
+
+def _after(order_col, id_col, value, last_id, descending: bool):
+    """排在游标 (value, last_id) 之后的行"""
+    if descending:
+        if value is None:
+            return db.and_(order_col.is_(None), id_col < last_id)
+        after = [order_col < value, db.and_(order_col == value, id_col < last_id)]
+        if _nullable(order_col):
+            after.append(order_col.is_(None))
+        return db.or_(*after)
+    if value is None:
+        return db.or_(order_col.isnot(None), id_col > last_id)
+    return db.or_(order_col > value, db.and_(order_col == value, id_col > last_id))
+
+
+def keyset_page(query, order_col, id_col, limit: int, cursor: str = None, descending: bool = True):
+    """
+    取一页数据
+    :param order_col: 排序列（如 BpRecord.measured_at）；与 id_col 相同时只按主键分页
+    :param id_col: 主键列，保证排序唯一
+    :return: (本页对象列表, next_cursor 或 None)
+    """
+    single = order_col is id_col
+    columns = [id_col] if single else [order_col, id_col]
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if single:
+            query = query.filter(id_col < values[0] if descending else id_col > values[0])
+        else:
+            query = query.filter(_after(order_col, id_col, values[0], values[1], descending))
+
+    ordering = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(None).order_by(*ordering).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in columns])
+    return rows, next_cursor
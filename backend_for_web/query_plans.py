@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+热点查询的执行计划检查（flask check-query-plans）
+对各列表接口实际使用的查询执行 EXPLAIN，出现全表扫描或额外排序（filesort / 临时 B 树）时判定为退化，
+命令以非 0 状态退出，可放在部署前或 CI 中执行。
+  - SQLite：EXPLAIN QUERY PLAN，禁止 “SCAN <表>”（无索引）和 “USE TEMP B-TREE FOR ORDER BY”
+  - MySQL：EXPLAIN，禁止 type=ALL 和 Extra 中的 “Using filesort”
+MySQL 会按表的统计信息选择计划，几行数据的空库上可能直接全表扫描，请在有真实数据量的库上检查。
+"""
+
+import re
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from models import db, Patient, Doctor, BpRecord, BpLatest, Medicine, DocMsg, Reminder, PatientReminder, ChatMessage, \
+    ConversationSummary
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement, prefix: str):
+        self.statement = statement
+        self.prefix = prefix
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return f"{element.prefix} {compiler.process(element.statement, **kw)}"
+
+
+def key_queries() -> list:
+    """(名称, 查询语句)；与接口里的查询保持一致，示例参数不影响执行计划"""
+    user_id, doctor_id = 1, 1
+    cutoff = datetime.now(timezone.utc) - timedelta(days=7)
+    return [
+        ("血压记录分页", BpRecord.query.filter_by(user_id=user_id)
+            .order_by(BpRecord.measured_at.desc(), BpRecord.record_id.desc()).limit(21)),
+        ("用药分页", Medicine.query.filter_by(user_id=user_id)
+            .order_by(Medicine.start_date.desc(), Medicine.med_id.desc()).limit(21)),
+        ("医生留言分页", DocMsg.query.filter_by(user_id=user_id)
+            .order_by(DocMsg.created_at.desc(), DocMsg.msg_id.desc()).limit(21)),
+        ("定时提醒增量同步", Reminder.query.filter(Reminder.updated_at >= cutoff).order_by(Reminder.updated_at.asc(), Reminder.plan_id.asc())),
+        ("定时提醒分页", Reminder.query.filter_by(user_id=user_id)
+            .order_by(Reminder.created_at.desc(), Reminder.plan_id.desc()).limit(21)),
+        ("患者提醒分页", PatientReminder.query.filter(
+            PatientReminder.user_id == user_id, PatientReminder.created_at >= cutoff
+        ).order_by(PatientReminder.created_at.desc(), PatientReminder.id.desc()).limit(21)),
+        ("聊天消息分页", ChatMessage.query.filter(
+            ChatMessage.patient_id == user_id, ChatMessage.doctor_id == doctor_id
+        ).order_by(ChatMessage.created_at.desc(), ChatMessage.msg_id.desc()).limit(21)),
+        ("聊天全部消息", ChatMessage.query.filter(
+            ChatMessage.patient_id == user_id, ChatMessage.doctor_id == doctor_id
+        ).order_by(ChatMessage.created_at.asc(), ChatMessage.msg_id.asc())),
+        ("聊天增量同步", ChatMessage.query.filter(
+            ChatMessage.patient_id == user_id, ChatMessage.doctor_id == doctor_id, ChatMessage.msg_id > 100
+        ).order_by(ChatMessage.msg_id.asc()).limit(201)),
+        ("聊天 ETag", db.session.query(
+            db.func.max(ChatMessage.msg_id), db.func.count(ChatMessage.msg_id),
+            db.func.sum(db.cast(ChatMessage.is_read, db.Integer))
+        ).filter(ChatMessage.patient_id == user_id, ChatMessage.doctor_id == doctor_id)),
+        ("聊天增量 ETag", db.session.query(
+            db.func.max(ChatMessage.msg_id), db.func.count(ChatMessage.msg_id),
+            db.func.sum(db.cast(ChatMessage.is_read, db.Integer))
+        ).filter(ChatMessage.patient_id == user_id, ChatMessage.doctor_id == doctor_id, ChatMessage.msg_id > 100)),
+        ("聊天未读数", db.session.query(db.func.count(ChatMessage.msg_id)).filter(
+            ChatMessage.patient_id == user_id,
+            ChatMessage.doctor_id == doctor_id,
+            ChatMessage.sender_type != "doctor",
+            ChatMessage.is_read == False
+        )),
+        ("村内患者", Patient.query.filter(Patient.village == "示例村")
+            .order_by(Patient.name.asc(), Patient.user_id.asc())),
+        ("医生首页概览", db.session.query(Patient, BpLatest).outerjoin(
+            BpLatest, BpLatest.user_id == Patient.user_id
+        ).filter(Patient.village == "示例村").order_by(Patient.name.asc(), Patient.user_id.asc())),
+        # 收件箱按最近消息排序，只能对本村的几十行排序，这里只检查过滤和连接是否走索引
+        ("医生收件箱", db.session.query(Patient, ConversationSummary).outerjoin(ConversationSummary, db.and_(
+            ConversationSummary.patient_id == Patient.user_id, ConversationSummary.doctor_id == doctor_id
+        )).filter(Patient.village == "示例村")),
+        ("患者收件箱", db.session.query(Doctor, ConversationSummary).outerjoin(ConversationSummary, db.and_(
+            ConversationSummary.doctor_id == Doctor.worker_id, ConversationSummary.patient_id == user_id
+        )).filter(Doctor.village == "示例村")),
+    ]
+
+
+def _sqlite_problems(rows) -> tuple:
+    lines = [row[-1] for row in rows]
+    problems = []
+    for line in lines:
+        if re.match(r"^SCAN \S+( AS \S+)?$", line):
+            problems.append(f"全表扫描: {line}")
+        if "USE TEMP B-TREE FOR ORDER BY" in line:
+            problems.append(f"额外排序: {line}")
+    return lines, problems
+
+
+def _mysql_problems(rows) -> tuple:
+    lines = []
+    problems = []
+    for row in rows:
+        row = dict(row._mapping)
+        line = f"{row.get('table')}: type={row.get('type')} key={row.get('key')} rows={row.get('rows')} {row.get('Extra') or ''}"
+        lines.append(line.strip())
+        if row.get("type") == "ALL":
+            problems.append(f"全表扫描: {line}")
+        if "Using filesort" in (row.get("Extra") or ""):
+            problems.append(f"filesort: {line}")
+    return lines, problems
+
+
+def check_query_plans() -> list:
+    """返回 [{"name", "plan": [...], "problems": [...]}]，problems 为空表示通过"""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        prefix, analyze = "EXPLAIN QUERY PLAN", _sqlite_problems
+    elif dialect in ("mysql", "mariadb"):
+        prefix, analyze = "EXPLAIN", _mysql_problems
+    else:
+        raise RuntimeError(f"不支持检查 {dialect} 的执行计划")
+
+    results = []
+    for name, query in key_queries():
+        rows = db.session.connection().execute(_Explain(query.statement, prefix)).fetchall()
+        plan, problems = analyze(rows)
+        results.append({"name": name, "plan": plan, "problems": problems})
+    db.session.rollback()
+    return results
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+定时提醒（Reminder 表）派发引擎
+启动时把所有启用的提醒加载进按到期时间排序的小顶堆，定时 tick 只弹出已到期的条目批量派发，
+然后计算下一次到期时间重新入堆。提醒新建、修改、停用时增量更新堆，不需要每次 tick 重新扫表。
+每次 tick 的开销只和到期条目数有关（O(k log n)），与提醒总数无关。
+多进程部署时只有拿到文件锁的进程派发；其他 worker 上的修改由 sync_changes() 在每次 tick 前
+按 updated_at 水位线增量读取（走 ix_reminder_updated_at 索引，只读变化的行）。
+实际推送通道通过 REMINDER_DELIVER（模块:函数）接入，见 resolve_deliver()。
+
+提醒时间规则：
+  - cron_expr 优先（标准 5 段 crontab，如 "0 8 * * 1-5"）
+  - 否则使用 time_of_day + weekdays，weekdays 为逗号分隔的 1-7（周一到周日），支持 "1-5" 区间，为空表示每天
+"""
+
+import heapq
+import importlib
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from models import db, Reminder
+
+# 派发时携带的提醒信息（只保留派发需要的字段，10 万条提醒也只占少量内存）
+ReminderSpec = namedtuple("ReminderSpec", [
+    "plan_id", "user_id", "plan_type", "title", "description", "channel", "time_of_day", "weekdays", "cron_expr"
+])
+DueReminder = namedtuple("DueReminder", ["spec", "due_at"])
+
+# 构造 ReminderSpec 需要读取的列
+_SPEC_COLUMNS = (
+    Reminder.plan_id, Reminder.user_id, Reminder.plan_type, Reminder.title, Reminder.description,
+    Reminder.channel, Reminder.time_of_day, Reminder.weekdays, Reminder.cron_expr
+)
+
+
+def parse_weekdays(value) -> frozenset:
+    """
+    '1,3,5' / '1-5' -> {1, 3, 5} / {1..5}；0 和 7 都表示周日；为空返回空集合（每天）
+    格式不对（非数字、超出 0-7、区间倒置）时抛出 ValueError
+    """
+    days = set()
+    for part in (value or "").replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+            if start > end:
+                raise ValueError(f"星期区间无效: {part}")
+            days.update(range(start, end + 1))
+        else:
+            days.add(int(part))
+    if any(d < 0 or d > 7 for d in days):
+        raise ValueError(f"星期只能是 0-7: {value}")
+    return frozenset(7 if d == 0 else d for d in days)
+
+
+def validate_schedule(weekdays, cron_expr):
+    """
+    接口保存提醒前校验时间规则，返回规范化后的 (weekdays, cron_expr)，格式不对时抛出 ValueError
+    """
+    if weekdays is not None and not isinstance(weekdays, str):
+        raise ValueError("weekdays 须为字符串，如 \"1,3,5\" 或 \"1-5\"")
+    if cron_expr is not None and not isinstance(cron_expr, str):
+        raise ValueError("cron_expr 须为字符串")
+    parse_weekdays(weekdays)
+    cron_expr = (cron_expr or "").strip() or None
+    if cron_expr:
+        from apscheduler.triggers.cron import CronTrigger
+        CronTrigger.from_crontab(cron_expr)
+    return (weekdays or "").strip() or None, cron_expr
+
+
+def _spec_from_row(row) -> ReminderSpec:
+    return ReminderSpec(
+        plan_id=row.plan_id,
+        user_id=row.user_id,
+        plan_type=row.plan_type.value if row.plan_type else None,
+        title=row.title,
+        description=row.description,
+        channel=row.channel.value if row.channel else None,
+        time_of_day=row.time_of_day,
+        weekdays=parse_weekdays(row.weekdays),
+        cron_expr=(row.cron_expr or "").strip() or None,
+    )
+
+
+class ReminderDispatcher:
+    """
+    定时提醒派发器
+      - load_all()：启动时加载全部启用的提醒
+      - upsert(reminder) / remove(plan_id)：提醒新建、修改、停用时增量更新
+      - sync_changes()：读取其他进程修改过的提醒（updated_at 不早于水位线减回看秒数的行）
+      - tick()：弹出已到期的提醒，按批交给 deliver 回调
+    堆中的过期条目采用延迟删除：每个提醒带版本号，版本不一致的条目出堆时直接丢弃
+    """
+
+    def __init__(self, deliver, tz_offset_hours: int = 8, batch_size: int = 500, sync_lookback_seconds: int = 60):
+        """
+        :param deliver: 派发回调 deliver(list[DueReminder])
+        :param tz_offset_hours: time_of_day / cron 表达式所在时区（默认东八区）
+        :param batch_size: 每批派发的最大条数
+        :param sync_lookback_seconds: 增量同步时水位线往前回看的秒数（覆盖各 worker 的时钟偏差和提交延迟）
+        """
+        self.deliver = deliver
+        self.tz = timezone(timedelta(hours=tz_offset_hours))
+        self.batch_size = batch_size
+        self.sync_lookback = timedelta(seconds=sync_lookback_seconds)
+        self._heap = []
+        self._entries = {}
+        self._cron_cache = {}
+        self._lock = threading.Lock()
+        # 增量同步：已读到的最大 updated_at，以及回看窗口内已应用过的 plan_id -> updated_at
+        self._loaded = False
+        self._watermark = None
+        self._applied = {}
+        self.fired = 0
+        self.synced = 0
+        self.last_tick_ms = 0.0
+
+    # ---------- 到期时间计算 ----------
+
+    def _cron_trigger(self, expr: str):
+        trigger = self._cron_cache.get(expr)
+        if trigger is None:
+            from apscheduler.triggers.cron import CronTrigger
+            trigger = self._cron_cache[expr] = CronTrigger.from_crontab(expr, timezone=self.tz)
+        return trigger
+
+    def next_due(self, spec: ReminderSpec, after: datetime):
+        """计算 after 之后的下一次到期时间（带时区），无法计算时返回 None"""
+        after = after.astimezone(self.tz)
+        if spec.cron_expr:
+            try:
+                return self._cron_trigger(spec.cron_expr).get_next_fire_time(None, after + timedelta(seconds=1))
+            except Exception as e:
+                print(f"提醒 {spec.plan_id} 的 cron 表达式无效: {spec.cron_expr} ({e})")
+                return None
+        if spec.time_of_day is None:
+            return None
+        for offset in range(8):
+            day = after.date() + timedelta(days=offset)
+            if spec.weekdays and day.isoweekday() not in spec.weekdays:
+                continue
+            due = datetime.combine(day, spec.time_of_day.replace(tzinfo=None), tzinfo=self.tz)
+            if due > after:
+                return due
+        return None
+
+    # ---------- 增量维护 ----------
+
+    @staticmethod
+    def _safe_spec(row):
+        """时间规则无效的提醒（如库里已有的脏数据）记录日志后跳过，返回 None"""
+        try:
+            return _spec_from_row(row)
+        except (ValueError, TypeError) as e:
+            print(f"提醒 {row.plan_id} 的时间规则无效，跳过: weekdays={row.weekdays!r} ({e})")
+            return None
+
+    def _push(self, spec: ReminderSpec, after: datetime):
+        """计算下次到期时间并入堆（调用方需持有 self._lock）"""
+        version = self._entries[spec.plan_id][0] if spec.plan_id in self._entries else 0
+        due = self.next_due(spec, after)
+        if due is None:
+            self._entries.pop(spec.plan_id, None)
+            return
+        self._entries[spec.plan_id] = (version, spec)
+        heapq.heappush(self._heap, (due.timestamp(), spec.plan_id, version))
+
+    def load_all(self) -> int:
+        """从数据库加载所有启用的提醒，返回加载条数"""
+        now = datetime.now(self.tz)
+        # 先取水位线再读全表：读表期间的修改由之后的 sync_changes 补上
+        watermark = db.session.query(db.func.max(Reminder.updated_at)).scalar()
+        rows = db.session.query(*_SPEC_COLUMNS, Reminder.updated_at).filter(Reminder.enabled == True).yield_per(1000)
+        cutoff = watermark - self.sync_lookback if watermark else None
+
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+            self._loaded = True
+            self._watermark = watermark
+            self._applied = {}
+            for row in rows:
+                # 回看窗口内的行记下版本，之后的增量同步不再重复应用
+                if cutoff and row.updated_at and row.updated_at >= cutoff:
+                    self._applied[row.plan_id] = row.updated_at
+                spec = self._safe_spec(row)
+                if spec is not None:
+                    self._push(spec, now)
+            return len(self._entries)
+
+    def upsert(self, reminder: Reminder):
+        """提醒新建或修改后调用；已停用的提醒会被移出队列"""
+        with self._lock:
+            self._applied[reminder.plan_id] = getattr(reminder, "updated_at", None)
+        spec = self._safe_spec(reminder) if reminder.enabled else None
+        if spec is None:
+            self.remove(reminder.plan_id)
+            return
+        with self._lock:
+            # 版本号加一，堆里该提醒的旧条目全部作废
+            version = self._entries[spec.plan_id][0] + 1 if spec.plan_id in self._entries else 0
+            self._entries[spec.plan_id] = (version, spec)
+            self._push(spec, datetime.now(self.tz))
+            self._maybe_compact()
+
+    def sync_changes(self) -> int:
+        """
+        读取 updated_at 不早于 (水位线 - 回看秒数) 的提醒并增量更新，返回应用的条数
+        回看窗口内已经应用过的同一版本（plan_id, updated_at 相同）跳过，不会重复入堆；load_all 之前不做任何事
+        """
+        if not self._loaded:
+            return 0
+        watermark = self._watermark
+        # 表为空时还没有水位线，读取所有带修改时间的行
+        since = Reminder.updated_at >= watermark - self.sync_lookback if watermark else Reminder.updated_at.isnot(None)
+        rows = db.session.query(*_SPEC_COLUMNS, Reminder.enabled, Reminder.updated_at).filter(since)\
+            .order_by(Reminder.updated_at.asc(), Reminder.plan_id.asc()).all()
+
+        applied = 0
+        for row in rows:
+            if self._applied.get(row.plan_id) == row.updated_at:
+                continue
+            self.upsert(row)
+            applied += 1
+            watermark = max(watermark, row.updated_at) if watermark else row.updated_at
+        with self._lock:
+            self._watermark = watermark
+            if watermark:
+                cutoff = watermark - self.sync_lookback
+                self._applied = {k: v for k, v in self._applied.items() if v is not None and v >= cutoff}
+        self.synced += applied
+        return applied
+
+    def remove(self, plan_id: int):
+        """提醒停用或删除后调用"""
+        with self._lock:
+            self._entries.pop(plan_id, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        """作废条目超过一半时重建堆，避免堆无限增长（调用方需持有 self._lock）"""
+        if len(self._heap) > 1024 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [item for item in self._heap
+                          if item[1] in self._entries and self._entries[item[1]][0] == item[2]]
+            heapq.heapify(self._heap)
+
+    # ---------- 派发 ----------
+
+    def tick(self, now: datetime = None) -> int:
+        """派发所有已到期的提醒，返回派发条数"""
+        started = time.perf_counter()
+        now = now or datetime.now(self.tz)
+        now_ts = now.timestamp()
+        fired = 0
+        while True:
+            batch = []
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now_ts and len(batch) < self.batch_size:
+                    due_ts, plan_id, version = heapq.heappop(self._heap)
+                    entry = self._entries.get(plan_id)
+                    if entry is None or entry[0] != version:
+                        continue
+                    spec = entry[1]
+                    due_at = datetime.fromtimestamp(due_ts, self.tz)
+                    batch.append(DueReminder(spec, due_at))
+                    # 从本次到期时间往后推算，避免错过的提醒在同一次 tick 内重复派发
+                    self._push(spec, max(due_at, now))
+            if not batch:
+                break
+            try:
+                self.deliver(batch)
+            except Exception as e:
+                print(f"派发定时提醒失败: {e}")
+            fired += len(batch)
+        self.fired += fired
+        self.last_tick_ms = (time.perf_counter() - started) * 1000
+        return fired
+
+    def upcoming(self, until: datetime):
+        """
+        按到期时间顺序列出 until 之前将要到期的提醒，不修改队列
+        用辅助堆按序遍历，开销只和窗口内条目数有关
+        """
+        until_ts = until.timestamp()
+        with self._lock:
+            heap = self._heap
+            entries = self._entries
+            result = []
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier:
+                (due_ts, plan_id, version), index = heapq.heappop(frontier)
+                if due_ts > until_ts:
+                    continue
+                entry = entries.get(plan_id)
+                if entry is not None and entry[0] == version:
+                    result.append(DueReminder(entry[1], datetime.fromtimestamp(due_ts, self.tz)))
+                for child in (2 * index + 1, 2 * index + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            next_due = None
+            if self._heap:
+                next_due = datetime.fromtimestamp(self._heap[0][0], self.tz).isoformat()
+            return {
+                "reminders": len(self._entries),
+                "heap_size": len(self._heap),
+                "next_due": next_due,
+                "fired": self.fired,
+                "synced": self.synced,
+                "watermark": self._watermark.isoformat() if self._watermark else None,
+                "last_tick_ms": round(self.last_tick_ms, 2),
+            }
+
+
+def log_deliver(batch, audio_urls=None):
+    """
+    未配置 REMINDER_DELIVER 时的派发回调：只按渠道汇总打印，不实际推送
+    audio_urls: 语音提醒 plan_id -> 预渲染音频路径（未预渲染为 None）
+    """
+    by_channel = {}
+    for item in batch:
+        by_channel.setdefault(item.spec.channel, []).append(item.spec.plan_id)
+    for channel, plan_ids in by_channel.items():
+        print(f"派发定时提醒 [{channel}] {len(plan_ids)} 条: {plan_ids[:20]}")
+    if audio_urls:
+        missing = [plan_id for plan_id, url in audio_urls.items() if not url]
+        if missing:
+            print(f"语音提醒未预渲染 {len(missing)} 条: {missing[:20]}")
+
+
+def resolve_deliver(path: str):
+    """
+    派发回调的接入点：REMINDER_DELIVER="模块:函数"（如 "push_channels:deliver_reminders"），
+    函数签名 deliver(batch: list[DueReminder], audio_urls: dict)，在其中调用 App 推送 / 短信 / 语音外呼；
+    为空时返回 log_deliver（只打印）
+    """
+    if not path:
+        print("未配置 REMINDER_DELIVER：定时提醒只打印日志，不实际推送")
+        return log_deliver
+    module_name, _, attr = path.partition(":")
+    if not module_name or not attr:
+        raise RuntimeError(f"REMINDER_DELIVER 格式应为 模块:函数，当前为 {path}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def acquire_process_lock(lock_path: str):
+    """
+    多进程部署（gunicorn -w N）时只让一个进程派发定时提醒：拿到文件锁的进程负责派发
+    返回锁文件对象（需保持引用直到进程退出），未拿到锁返回 None；不支持 fcntl 的平台直接视为拿到锁
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    lock_file = open(lock_path, "a+")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    return lock_file
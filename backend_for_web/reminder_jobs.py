@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+医生提醒群发后台任务
+接口只负责创建 DoctorReminder 和 ReminderJob 并立即返回任务ID，
+目标患者查询、语音合成和逐批写入 PatientReminder 都在线程池里完成。
+任务进度保存在 reminder_jobs 表中，进程重启后未完成的任务会被重新认领续跑。
+认领时写入随机的 claim_token，之后每次提交都带上 “WHERE claim_token = 本次令牌” 续约；
+心跳超时被其他进程重新认领后，原执行者续约失败，回滚本批并退出，不会重复写入。
+等待语音合成期间由后台线程定时续约，租约不会因排队等待而过期。
+"""
+
+import json
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+from models import db, Patient, Doctor, BpLatest, DoctorReminder, PatientReminder, ReminderJob
+from tts import SpeechBusyError
+from dashboard import abnormal_bp_clause
+
+# 最多保存的失败明细条数，避免单个任务的 errors 字段无限增长
+MAX_ERROR_DETAILS = 200
+
+
+class LeaseLost(Exception):
+    """任务已被其他进程重新认领"""
+
+
+# 按 ID 列表查询 bp_latest 时每条 IN 的最多个数
+ID_CHUNK_SIZE = 500
+
+
+def _latest_ids(ids: list, *conditions) -> set:
+    """bp_latest 中满足条件的患者ID（按主键 IN 分批查询）"""
+    found = set()
+    for i in range(0, len(ids), ID_CHUNK_SIZE):
+        found.update(row[0] for row in db.session.query(BpLatest.user_id).filter(
+            BpLatest.user_id.in_(ids[i:i + ID_CHUNK_SIZE]), *conditions
+        ).all())
+    return found
+
+
+def select_target_patient_ids(village: str, target_type: str, village_index=None) -> list:
+    """
+    按提醒类型查询村内目标患者ID
+    target_type: 'all' / 'noRecord'（7天内未记录血压）/ 'abnormal'（最近一次血压异常）
+    村内患者ID取自 village_index（没有时查 patients 表），再按主键查 bp_latest 筛选
+    """
+    if village_index is not None:
+        ids = village_index.patient_ids(village)
+    else:
+        ids = [row[0] for row in db.session.query(Patient.user_id).filter(
+            Patient.village == village
+        ).order_by(Patient.user_id.asc()).all()]
+
+    if target_type == 'all':
+        return ids
+    if target_type == 'noRecord':
+        # 最近一次测量早于 7 天前（或从未测量）即 7 天内没有记录
+        seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+        recent = _latest_ids(ids, BpLatest.measured_at >= seven_days_ago)
+        return [i for i in ids if i not in recent]
+    # abnormal
+    abnormal = _latest_ids(ids, abnormal_bp_clause(BpLatest))
+    return [i for i in ids if i in abnormal]
+
+
+class ReminderJobRunner:
+    """
+    提醒群发任务执行器
+      - submit(job_id)：提交到线程池
+      - resume_pending()：认领排队中或心跳超时的任务（用于进程重启后续跑）
+    多个进程同时运行时，通过带条件的 UPDATE 认领任务，保证同一任务只有一个执行者
+    """
+
+    def __init__(self, app, tts_cache, max_workers: int = 2, batch_size: int = 50, lease_seconds: int = 120):
+        self.app = app
+        self.tts_cache = tts_cache
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reminder-job")
+
+    def submit(self, job_id: int):
+        self.executor.submit(self._run_safely, job_id)
+
+    def resume_pending(self) -> int:
+        """把未完成的任务重新放回线程池，返回放回的任务数"""
+        stale_before = datetime.now(timezone.utc) - self.lease
+        job_ids = [row[0] for row in db.session.query(ReminderJob.id).filter(
+            db.or_(
+                ReminderJob.status == 'queued',
+                db.and_(ReminderJob.status == 'running', ReminderJob.heartbeat_at < stale_before)
+            )
+        ).order_by(ReminderJob.id.asc()).all()]
+        for job_id in job_ids:
+            self.submit(job_id)
+        if job_ids:
+            print(f"续跑未完成的提醒任务: {job_ids}")
+        return len(job_ids)
+
+    def _claim(self, job_id: int):
+        """认领任务，成功时返回本次的 claim_token，否则返回 None"""
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        claimed = ReminderJob.query.filter(
+            ReminderJob.id == job_id,
+            db.or_(
+                ReminderJob.status == 'queued',
+                db.and_(ReminderJob.status == 'running', ReminderJob.heartbeat_at < now - self.lease)
+            )
+        ).update({"status": "running", "heartbeat_at": now, "claim_token": token}, synchronize_session=False)
+        db.session.commit()
+        return token if claimed == 1 else None
+
+    def _renew(self, job_id: int, token: str):
+        """
+        在当前事务里续约（UPDATE ... WHERE claim_token = 本次令牌），令牌已被替换时回滚并抛出 LeaseLost
+        续约的 UPDATE 锁住任务行直到提交，提交前其他进程无法重新认领
+        """
+        renewed = ReminderJob.query.filter(
+            ReminderJob.id == job_id,
+            ReminderJob.claim_token == token,
+            ReminderJob.status == 'running'
+        ).update({"heartbeat_at": datetime.now(timezone.utc)}, synchronize_session=False)
+        if renewed != 1:
+            db.session.rollback()
+            raise LeaseLost(job_id)
+
+    def _keep_alive(self, job_id: int, token: str):
+        """长时间等待（语音合成排队）期间每 1/4 租约续约一次，返回停止函数"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease.total_seconds() / 4):
+                with self.app.app_context():
+                    try:
+                        self._renew(job_id, token)
+                        db.session.commit()
+                    except LeaseLost:
+                        return
+                    except Exception as e:
+                        print(f"提醒任务 {job_id} 续约失败: {e}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        threading.Thread(target=beat, name=f"reminder-job-{job_id}-heartbeat", daemon=True).start()
+        return stop.set
+
+    def _run_safely(self, job_id: int):
+        with self.app.app_context():
+            token = None
+            try:
+                token = self._claim(job_id)
+                if token:
+                    self._run(job_id, token)
+            except LeaseLost:
+                print(f"提醒任务 {job_id} 已被其他进程接管，本进程停止执行")
+            except Exception as e:
+                print(f"提醒任务 {job_id} 执行失败: {str(e)}")
+                print(f"详细错误堆栈:\n{traceback.format_exc()}")
+                db.session.rollback()
+                job = ReminderJob.query.get(job_id)
+                if job and token and job.claim_token == token and job.status == 'running':
+                    try:
+                        self._finish(job, token, 'failed', [{"user_id": None, "error": str(e)}])
+                    except LeaseLost:
+                        pass
+            finally:
+                db.session.remove()
+
+    def _run(self, job_id: int, token: str):
+        job = ReminderJob.query.get(job_id)
+        reminder = DoctorReminder.query.get(job.doctor_reminder_id)
+        print(f"\n========== 执行提醒任务 {job_id} ==========")
+
+        # 第一步：确定目标患者（首次运行时保存快照，续跑时沿用）
+        if job.target_ids is None:
+            doctor = Doctor.query.get(reminder.doctor_id)
+            target_ids = select_target_patient_ids(
+                doctor.village, reminder.target_type, self.app.extensions.get("village_index")
+            )
+            self._renew(job_id, token)
+            job.target_ids = json.dumps(target_ids)
+            job.total = len(target_ids)
+            db.session.commit()
+            print(f"找到 {len(target_ids)} 名目标患者")
+        else:
+            target_ids = json.loads(job.target_ids)
+
+        if not target_ids:
+            self._finish(job, token, 'failed', [{"user_id": None, "error": "未找到符合条件的患者"}])
+            return
+
+        # 第二步：生成语音（所有患者共用同一份缓存音频），走批量优先级，让位给交互请求
+        # 排队最长 XFYUN_BULK_TIMEOUT 秒，期间后台续约
+        stop_keep_alive = self._keep_alive(job_id, token)
+        try:
+            audio_url = self.tts_cache.get_or_synthesize(reminder.content, voice="xiaoyan", aue="lame", priority="bulk")
+        except SpeechBusyError as e:
+            # 语音服务繁忙：放回队列，由定时续跑任务稍后重试
+            print(f"提醒任务 {job_id} 暂缓执行: {str(e)}")
+            self._renew(job_id, token)
+            job.status = 'queued'
+            db.session.commit()
+            return
+        except Exception as e:
+            self._finish(job, token, 'failed', [{"user_id": None, "error": f"音频处理失败: {str(e)}"}])
+            return
+        finally:
+            stop_keep_alive()
+        # 等待期间 job 对象可能已过期，重新读取进度
+        db.session.refresh(job)
+
+        # 第三步：从上次的进度处继续，逐批写入患者提醒
+        for start in range(job.processed or 0, len(target_ids), self.batch_size):
+            batch = target_ids[start:start + self.batch_size]
+            # 先续约（锁住任务行），本批写入期间其他进程无法认领
+            self._renew(job_id, token)
+            # 上次中断时可能已写入一部分，跳过已存在的记录
+            existing = set(row[0] for row in db.session.query(PatientReminder.user_id).filter(
+                PatientReminder.doctor_reminder_id == reminder.id,
+                PatientReminder.user_id.in_(batch)
+            ).all())
+            valid = set(row[0] for row in db.session.query(Patient.user_id).filter(
+                Patient.user_id.in_(batch)
+            ).all())
+
+            errors = []
+            success = 0
+            for user_id in batch:
+                if user_id in existing:
+                    success += 1
+                elif user_id not in valid:
+                    errors.append({"user_id": user_id, "error": "患者不存在"})
+                else:
+                    db.session.add(PatientReminder(
+                        doctor_reminder_id=reminder.id,
+                        user_id=user_id,
+                        audio_path=audio_url
+                    ))
+                    success += 1
+
+            # 进度和本批记录在同一个事务里提交，重启后不会重复或遗漏
+            # （(doctor_reminder_id, patient_id) 唯一约束兜底，重复写入时整批回滚）
+            job.processed = start + len(batch)
+            job.success_count = (job.success_count or 0) + success
+            job.failed_count = (job.failed_count or 0) + len(errors)
+            if errors:
+                self._append_errors(job, errors)
+            db.session.commit()
+            print(f"提醒任务 {job_id} 进度: {job.processed}/{job.total}")
+
+        self._finish(job, token, 'succeeded' if job.success_count else 'failed', [])
+        print(f"提醒任务 {job_id} 完成：成功 {job.success_count}，失败 {job.failed_count}")
+
+    def _append_errors(self, job: ReminderJob, errors: list):
+        current = json.loads(job.errors) if job.errors else []
+        current.extend(errors)
+        job.errors = json.dumps(current[:MAX_ERROR_DETAILS], ensure_ascii=False)
+
+    def _finish(self, job: ReminderJob, token: str, status: str, errors: list):
+        self._renew(job.id, token)
+        if errors:
+            self._append_errors(job, errors)
+        job.status = status
+        job.finished_at = datetime.now(timezone.utc)
+        db.session.commit()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+语音定时提醒的音频预渲染
+channel=voice 的提醒如果到点才合成语音，讯飞的延迟会落在派发路径上，
+而且大量患者设置同一个时间点（如 08:00）时会在同一秒集中调用合成。
+预渲染定时扫描未来 N 小时内到期的语音提醒，按到期先后把音频提前合成进 TTS 缓存，
+每轮只合成一部分，把合成请求均匀摊开在整个窗口内；派发时直接取缓存里的音频。
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from tts import SpeechBusyError
+
+VOICE_CHANNEL = "voice"
+# 已确认合成过的文本多久后重新查一次存储（音频可能被保留任务淘汰）
+RENDERED_RECHECK_SECONDS = 3600
+
+
+def reminder_speech_text(spec) -> str:
+    """提醒播报的文本：标题 + 说明"""
+    parts = [p.strip() for p in (spec.title, spec.description) if p and p.strip()]
+    return "。".join(parts)
+
+
+class ReminderPrerenderer:
+    """
+    语音提醒预渲染器
+      - run_once()：由定时任务每 interval_seconds 调用一次，合成本轮配额内的音频
+      - audio_for(spec)：派发时查询已合成好的音频
+    每轮配额 = 待合成条数 * 本轮间隔 / 窗口长度（至少 1 条），即按窗口匀速合成；
+    即将到期（urgent_seconds 内）的提醒不受配额限制，保证派发前一定合成过
+    """
+
+    def __init__(self, dispatcher, tts_cache, lookahead_hours: int = 6, interval_seconds: int = 60,
+                 urgent_seconds: int = 300, voice: str = "xiaoyan", aue: str = "lame"):
+        self.dispatcher = dispatcher
+        self.tts_cache = tts_cache
+        self.lookahead = timedelta(hours=lookahead_hours)
+        self.interval = interval_seconds
+        self.urgent = timedelta(seconds=urgent_seconds)
+        self.voice = voice
+        self.aue = aue
+        self._lock = threading.Lock()
+        # 本进程已确认合成过的文本：缓存 key（文本哈希）-> 确认时间，只有不在其中的文本才去查存储
+        self._rendered = {}
+        self.rendered = 0
+        self.failed = 0
+        self.pending = 0
+        self.delivered_hits = 0
+        self.delivered_misses = 0
+        self.last_run_ms = 0.0
+
+    def _key(self, text: str) -> str:
+        return self.tts_cache.make_key(text, self.voice, self.aue)
+
+    def _pending_texts(self, now: datetime) -> list:
+        """
+        窗口内尚未合成的播报文本，按最早到期时间排序并去重，返回 [(due_at, text)]
+        本进程已确认过的文本不再查存储（S3 上每次查询都是一次请求），
+        超过 RENDERED_RECHECK_SECONDS 的才重新确认；离开窗口的文本从集合中移除
+        """
+        checked_at = time.monotonic()
+        rendered = {}
+        seen = set()
+        pending = []
+        for item in self.dispatcher.upcoming(now + self.lookahead):
+            if item.spec.channel != VOICE_CHANNEL:
+                continue
+            text = reminder_speech_text(item.spec)
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            key = self._key(text)
+            confirmed = self._rendered.get(key)
+            if confirmed is not None and checked_at - confirmed < RENDERED_RECHECK_SECONDS:
+                rendered[key] = confirmed
+            elif self.tts_cache.contains(text, self.voice, self.aue):
+                rendered[key] = checked_at
+            else:
+                pending.append((item.due_at, text))
+        self._rendered = rendered
+        return pending
+
+    def run_once(self, now: datetime = None) -> int:
+        """合成本轮配额内的音频，返回本轮合成条数"""
+        if not self._lock.acquire(blocking=False):
+            return 0
+        started = time.perf_counter()
+        try:
+            now = now or datetime.now(self.dispatcher.tz)
+            pending = self._pending_texts(now)
+            quota = max(1, math.ceil(len(pending) * self.interval / self.lookahead.total_seconds()))
+            rendered = 0
+            for index, (due_at, text) in enumerate(pending):
+                if index >= quota and due_at - now > self.urgent:
+                    break
+                try:
+                    self.tts_cache.get_or_synthesize(text, voice=self.voice, aue=self.aue, priority="bulk")
+                    self._rendered[self._key(text)] = time.monotonic()
+                    rendered += 1
+                except SpeechBusyError as e:
+                    # 语音服务繁忙：本轮到此为止，下一轮继续
+                    print(f"预渲染提醒语音暂缓: {str(e)}")
+                    break
+                except Exception as e:
+                    self.failed += 1
+                    print(f"预渲染提醒语音失败: {str(e)}")
+            self.rendered += rendered
+            self.pending = len(pending) - rendered
+            return rendered
+        finally:
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            self._lock.release()
+
+    def audio_for(self, spec):
+        """派发时查询提醒音频：命中返回访问路径，未预渲染返回 None"""
+        text = reminder_speech_text(spec)
+        if not text:
+            return None
+        url = self.tts_cache.lookup(text, self.voice, self.aue)
+        if url:
+            self.delivered_hits += 1
+        else:
+            self.delivered_misses += 1
+        return url
+
+    def wrap_deliver(self, deliver):
+        """包装派发回调：语音提醒附带预渲染好的音频路径 deliver(batch, audio_urls)"""
+        def deliver_with_audio(batch):
+            audio_urls = {}
+            for item in batch:
+                if item.spec.channel == VOICE_CHANNEL:
+                    audio_urls[item.spec.plan_id] = self.audio_for(item.spec)
+            deliver(batch, audio_urls)
+        return deliver_with_audio
+
+    def stats(self) -> dict:
+        return {
+            "lookahead_hours": self.lookahead.total_seconds() / 3600,
+            "pending": self.pending,
+            "known_rendered": len(self._rendered),
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "delivered_hits": self.delivered_hits,
+            "delivered_misses": self.delivered_misses,
+            "last_run_ms": round(self.last_run_ms, 2),
+        }
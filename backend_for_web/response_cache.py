@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+读多写少接口的响应缓存
+医生列表、村内医生 / 患者列表、血压趋势分析几乎每次打开页面都会请求，但很少变化；
+这里缓存序列化好的 JSON 响应，命中时不再查询数据库、不再 to_dict。
+  - 每条缓存有过期时间（RESPONSE_CACHE_TTL 秒），到期后重新查询
+  - 按标签失效：缓存时记录所依赖标签（doctors / patients / bp_analysis:<患者ID>）的版本号，
+    创建、注册、更新时调用 invalidate(标签) 把版本号加 1，旧版本的缓存不再被读取，由 LRU / TTL 自然淘汰；
+    计算响应期间发生的失效不会被覆盖（写入的是计算前的版本）
+后端（RESPONSE_CACHE_BACKEND）：
+  - lru：进程内 LRU（默认；多 worker 时各自缓存、各自失效，其他 worker 最多在 TTL 内读到旧数据）
+  - redis：多个 worker 共用（需要安装 redis；也可以注入兼容的客户端，如本地的 fakeredis）
+  - none：不缓存
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+
+class LruBackend:
+    """进程内 LRU，条目数有上限；标签版本号单独保存，不参与淘汰"""
+
+    name = "lru"
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags: list) -> list:
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tag: str):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """多个 worker 共用的 Redis 缓存（需要安装 redis，或传入兼容的 client）"""
+
+    name = "redis"
+
+    def __init__(self, url: str = None, prefix: str = "resp:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RESPONSE_CACHE_BACKEND=redis 需要安装 redis：pip install redis")
+            client = redis.Redis.from_url(url or "redis://127.0.0.1:6379/0")
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def versions(self, tags: list) -> list:
+        if not tags:
+            return []
+        return [int(v) if v is not None else 0 for v in self.client.mget([f"{self.prefix}tag:{t}" for t in tags])]
+
+    def bump(self, tag: str):
+        self.client.incr(f"{self.prefix}tag:{tag}")
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    """按请求路径（含查询参数）和标签版本号缓存 JSON 响应，只缓存 200 响应"""
+
+    def __init__(self, backend=None, ttl_seconds: int = 300):
+        self.backend = backend
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.invalidations = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _count(self, name: str, field: str):
+        with self._lock:
+            counters = self._stats.setdefault(name, {"hits": 0, "misses": 0})
+            counters[field] += 1
+
+    def cached(self, name: str, tags):
+        """
+        路由装饰器
+        :param name: 接口名（统计用，也是缓存键的前缀）
+        :param tags: 依赖的标签列表，或按路由参数返回标签列表的函数
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != "GET":
+                    return view(*args, **kwargs)
+                tag_list = tags(**kwargs) if callable(tags) else list(tags)
+                try:
+                    versions = self.backend.versions(tag_list)
+                    key = f"{name}:{request.full_path}:" + ",".join(map(str, versions))
+                    body = self.backend.get(key)
+                except Exception as e:
+                    # 缓存不可用时直接查询数据库
+                    print(f"读取响应缓存失败: {e}")
+                    self.errors += 1
+                    return view(*args, **kwargs)
+
+                if body is not None:
+                    self._count(name, "hits")
+                    response = Response(body, mimetype="application/json")
+                    response.headers["X-Cache"] = "HIT"
+                    return response
+
+                self._count(name, "misses")
+                response = view(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200 and response.is_json:
+                    try:
+                        self.backend.set(key, response.get_data(), self.ttl)
+                    except Exception as e:
+                        print(f"写入响应缓存失败: {e}")
+                        self.errors += 1
+                    response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        """数据提交后调用：依赖这些标签的缓存全部失效"""
+        if not self.enabled:
+            return
+        for tag in tags:
+            try:
+                self.backend.bump(tag)
+                self.invalidations += 1
+            except Exception as e:
+                # 失效失败时旧数据最多保留到 TTL
+                print(f"响应缓存失效失败 {tag}: {e}")
+                self.errors += 1
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            hits = misses = 0
+            for name, counters in self._stats.items():
+                total = counters["hits"] + counters["misses"]
+                endpoints[name] = dict(counters, hit_ratio=round(counters["hits"] / total, 4) if total else 0.0)
+                hits += counters["hits"]
+                misses += counters["misses"]
+        total = hits + misses
+        return {
+            "backend": self.backend.name if self.enabled else "none",
+            "ttl_seconds": self.ttl,
+            "entries": self.backend.size() if self.enabled else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "endpoints": endpoints,
+        }
+
+
+def make_response_cache(config) -> ResponseCache:
+    """按配置创建：RESPONSE_CACHE_BACKEND=lru（默认）/ redis / none"""
+    kind = (config.get("RESPONSE_CACHE_BACKEND") or "lru").lower()
+    ttl = config.get("RESPONSE_CACHE_TTL", 300)
+    if kind == "none":
+        return ResponseCache(None, ttl)
+    if kind == "redis":
+        return ResponseCache(RedisBackend(
+            url=config.get("RESPONSE_CACHE_REDIS_URL"),
+            prefix=config.get("RESPONSE_CACHE_PREFIX") or "resp:"
+        ), ttl)
+    return ResponseCache(LruBackend(config.get("RESPONSE_CACHE_MAX_ENTRIES", 2048)), ttl)
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""后端模块按平铺方式互相导入（from models import ...），测试时把 backend_for_web 加入导入路径"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
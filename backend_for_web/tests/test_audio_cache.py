@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""TtsAudioCache 在对象存储后端（S3BlobBackend + 内存中的 S3 客户端替身）上的行为"""
+
+from audio_cache import TtsAudioCache
+from audio_store import AudioStore
+from blob_backend import S3BlobBackend
+
+
+class NotFound(Exception):
+    """与 botocore ClientError 一样带 response["Error"]["Code"]"""
+
+    def __init__(self):
+        super().__init__("404")
+        self.response = {"Error": {"Code": "404"}}
+
+
+class Body:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+
+class FakeS3Client:
+    """只实现 S3BlobBackend 用到的几个方法；每次请求时检查缓存锁没有被持有"""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self.cache = None
+
+    def _request(self, name: str, key: str):
+        self.calls.append((name, key))
+        assert self.cache is None or not self.cache._lock.locked(), f"{name} 在缓存锁内执行"
+
+    def head_object(self, Bucket, Key):
+        self._request("head", Key)
+        if Key not in self.objects:
+            raise NotFound()
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key):
+        self._request("get", Key)
+        if Key not in self.objects:
+            raise NotFound()
+        return {"Body": Body(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._request("put", Key)
+        self.objects[Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self._request("delete", Key)
+        self.objects.pop(Key, None)
+
+
+def make_cache(client: FakeS3Client, synthesized: list) -> TtsAudioCache:
+    def synthesize(text, voice, aue, priority):
+        synthesized.append(text)
+        return f"audio:{text}".encode("utf-8")
+
+    store = AudioStore(S3BlobBackend("bucket", client=client, exists_ttl=0))
+    cache = TtsAudioCache(store, synthesize)
+    client.cache = cache
+    return cache
+
+
+def test_synthesize_once_and_share_through_alias():
+    client = FakeS3Client()
+    synthesized = []
+    cache = make_cache(client, synthesized)
+
+    url = cache.get_or_synthesize("按时服药")
+    assert url.startswith("/static/audio/")
+    assert cache.get_or_synthesize("按时服药") == url
+    assert synthesized == ["按时服药"]
+
+    # 另一个进程（新的缓存实例）通过别名命中，不再合成
+    other = make_cache(client, synthesized)
+    assert other.lookup("按时服药") == url
+    assert synthesized == ["按时服药"]
+    assert other.stats()["hits"] == 1
+
+
+def test_alias_miss_is_cached():
+    client = FakeS3Client()
+    cache = make_cache(client, [])
+
+    assert cache.lookup("没有合成过") is None
+    assert not cache.contains("没有合成过")
+    assert [name for name, _ in client.calls] == ["get"]
+    assert cache.stats()["negative_entries"] == 1
+
+    # 本进程合成后立即清除未命中记录
+    url = cache.get_or_synthesize("没有合成过")
+    assert cache.lookup("没有合成过") == url
+    assert cache.stats()["negative_entries"] == 0
+
+
+def test_deleted_audio_is_synthesized_again():
+    client = FakeS3Client()
+    synthesized = []
+    cache = make_cache(client, synthesized)
+
+    url = cache.get_or_synthesize("测量血压")
+    # 保留任务删除了音频（别名还在）
+    cache.store.delete(cache.store.key_from_url(url))
+    assert cache.lookup("测量血压") is None
+    assert cache.get_or_synthesize("测量血压") == url
+    assert synthesized == ["测量血压", "测量血压"]
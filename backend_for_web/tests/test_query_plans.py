@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""按模型建出的表结构（db.create_all）上，热点查询都能用到索引"""
+
+import pytest
+from flask import Flask
+
+from models import db
+from query_plans import check_query_plans
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_key_queries_use_indexes(app):
+    results = check_query_plans()
+    assert results
+    assert [(r["name"], r["problems"]) for r in results if r["problems"]] == []
@@ -2,15 +2,22 @@
 """
 讯飞 IAT（语音转文字）/ TTS（文字转语音）封装
 依赖：websocket-client, ffmpeg (系统安装)
+音频转码通过管道在内存中完成，不在 static/ 下生成临时文件
 """
 
 import base64
 import hashlib
 import hmac
+import io
 import json
 import os
 import ssl
 import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from contextlib import contextmanager
 from urllib.parse import urlencode, urlparse
 from datetime import datetime, timezone
 from websocket import create_connection
@@ -27,6 +34,41 @@ IAT_PATH = "/v2/iat"
 TTS_HOST = "wss://tts-api.xfyun.cn"
 TTS_PATH = "/v2/tts"
 
+# 鉴权 URL 缓存时间：讯飞要求 date 与服务器时间相差不超过 300 秒，留出余量
+AUTH_URL_TTL = 240
+# 预热连接最长闲置时间：讯飞约 10 秒收不到数据就会断开
+WARM_IDLE_SECONDS = 8
+# 每个主机同时进行的会话数上限
+MAX_SESSIONS_PER_HOST = int(os.environ.get("XFYUN_MAX_SESSIONS", "8"))
+# 每个主机保留的预热连接数（连续请求时会话结束后在后台补齐）
+WARM_SESSIONS_PER_HOST = int(os.environ.get("XFYUN_WARM_SESSIONS", "1"))
+
+# 流式识别每帧发送的 PCM 字节数与发送间隔
+# 讯飞建议每 40ms 发送 1280 字节（实时速率）；上传的是完整录音，默认每帧 5 倍大小，约 5 倍实时速率
+ASR_FRAME_BYTES = int(os.environ.get("XFYUN_ASR_FRAME_BYTES", str(1280 * 5)))
+ASR_FRAME_INTERVAL = float(os.environ.get("XFYUN_ASR_FRAME_INTERVAL", "0.04"))
+
+# 讯飞调用的准入控制：同时进行的调用总数（供应商并发配额），
+# 以及交互请求 / 批量合成两条优先级队列的长度上限和排队超时（秒）
+SPEECH_MAX_CONCURRENCY = int(os.environ.get("XFYUN_MAX_CONCURRENCY", "5"))
+SPEECH_QUEUE_LIMITS = {
+    "interactive": int(os.environ.get("XFYUN_INTERACTIVE_QUEUE", "20")),
+    "bulk": int(os.environ.get("XFYUN_BULK_QUEUE", "200")),
+}
+SPEECH_QUEUE_TIMEOUTS = {
+    "interactive": float(os.environ.get("XFYUN_INTERACTIVE_TIMEOUT", "5")),
+    "bulk": float(os.environ.get("XFYUN_BULK_TIMEOUT", "120")),
+}
+
+# 同时运行的 ffmpeg 转码进程数，以及排队等待的最长时间（秒）
+TRANSCODE_WORKERS = int(os.environ.get("FFMPEG_WORKERS", "2"))
+TRANSCODE_QUEUE_TIMEOUT = float(os.environ.get("FFMPEG_QUEUE_TIMEOUT", "30"))
+_transcode_slots = threading.BoundedSemaphore(TRANSCODE_WORKERS)
+
+
+class SpeechBusyError(RuntimeError):
+    """讯飞调用排队已满或排队超时"""
+
 
 def _rfc1123_date():
     return datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
@@ -70,97 +112,499 @@ def _auth_url(host_base: str, path: str):
     return f"{host_base}{path}?{qs}"
 
 
-def _ensure_pcm16k(src_path: str) -> str:
+class _SessionManager:
     """
-    用系统 ffmpeg 把音频转为：16kHz、单声道、16bit PCM（wav容器）
-    返回转换后的文件路径
+    讯飞 WebSocket 会话管理
+      - 鉴权 URL 在有效期内复用，不必每次重新计算 HMAC 签名
+      - 连续请求时（距上一次会话开始不到 WARM_IDLE_SECONDS 秒），会话结束后在后台预先建立好下一条连接，
+        突发请求可以跳过 TLS 握手；零星请求不预热，免得连接空等到过期
+      - 预热连接闲置超过 WARM_IDLE_SECONDS 秒即关闭（到期定时关闭，不等下一次请求）
+      - 每个主机的并发会话数有上限
+      - 分别统计握手耗时和数据收发耗时
+    讯飞每条连接只能完成一次识别/合成，因此连接用完即关闭，不放回池中
     """
-    if not os.path.exists(src_path):
-        raise FileNotFoundError(src_path)
-    dst_path = src_path + ".16k.wav"
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", src_path,
-        "-ar", "16000",
-        "-ac", "1",
-        "-acodec", "pcm_s16le",
-        "-f", "wav",
-        dst_path
-    ]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    return dst_path
 
+    def __init__(self, max_sessions: int, warm_size: int):
+        self.max_sessions = max_sessions
+        self.warm_size = warm_size
+        self._lock = threading.Lock()
+        self._urls = {}
+        self._idle = {}
+        self._warming = {}
+        self._last_started = {}
+        self._slots = {}
+        self._stats = {}
+
+    def _host_stats(self, host: str) -> dict:
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = {
+                "sessions": 0,
+                "in_use": 0,
+                "handshakes": 0,
+                "warm_hits": 0,
+                "warm_expired": 0,
+                "handshake_ms": 0.0,
+                "payload_ms": 0.0,
+            }
+        return stats
+
+    def signed_url(self, host_base: str, path: str) -> str:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._urls.get((host_base, path))
+            if cached and cached[1] > now:
+                return cached[0]
+        url = _auth_url(host_base, path)
+        with self._lock:
+            self._urls[(host_base, path)] = (url, now + AUTH_URL_TTL)
+        return url
+
+    def _open(self, host_base: str, path: str):
+        started = time.perf_counter()
+        ws = create_connection(self.signed_url(host_base, path), sslopt={"cert_reqs": ssl.CERT_NONE})
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._host_stats(host_base)
+            stats["handshakes"] += 1
+            stats["handshake_ms"] += elapsed
+        return ws
+
+    def _pop_expired(self, host_base: str, path: str) -> list:
+        """从预热队列取出过期或已断开的连接（调用方需持有 self._lock，并在锁外关闭）"""
+        now = time.monotonic()
+        idle = self._idle.get((host_base, path))
+        expired = []
+        while idle and (now - idle[0][1] >= WARM_IDLE_SECONDS or not idle[0][0].connected):
+            expired.append(idle.popleft()[0])
+        if expired:
+            self._host_stats(host_base)["warm_expired"] += len(expired)
+        return expired
+
+    @staticmethod
+    def _close_all(sockets: list):
+        for ws in sockets:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _expire_idle(self, host_base: str, path: str):
+        """预热连接到期时关闭（定时器回调）"""
+        with self._lock:
+            expired = self._pop_expired(host_base, path)
+        self._close_all(expired)
 
-def asr_iflytek(file_path: str, language="zh_cn") -> str:
+    def _take_idle(self, host_base: str, path: str):
+        """取一条仍然可用的预热连接，过期的直接关闭"""
+        ws = None
+        with self._lock:
+            expired = self._pop_expired(host_base, path)
+            idle = self._idle.get((host_base, path))
+            if idle:
+                ws = idle.popleft()[0]
+        self._close_all(expired)
+        return ws
+
+    def warm(self, host_base: str, path: str, count: int = None):
+        """在后台预先建立连接，直到预热连接数达到 count"""
+        count = self.warm_size if count is None else count
+        key = (host_base, path)
+        with self._lock:
+            have = len(self._idle.get(key, ())) + self._warming.get(key, 0)
+            need = max(0, count - have)
+            self._warming[key] = self._warming.get(key, 0) + need
+
+        def open_one():
+            try:
+                ws = self._open(host_base, path)
+                with self._lock:
+                    self._idle.setdefault(key, deque()).append((ws, time.monotonic()))
+                timer = threading.Timer(WARM_IDLE_SECONDS + 0.5, self._expire_idle, (host_base, path))
+                timer.daemon = True
+                timer.start()
+            except Exception as e:
+                print(f"预热讯飞连接失败: {e}")
+            finally:
+                with self._lock:
+                    self._warming[key] -= 1
+
+        for _ in range(need):
+            threading.Thread(target=open_one, daemon=True).start()
+
+    @contextmanager
+    def session(self, host_base: str, path: str):
+        """获取一条连接，用完关闭；连续请求时在后台补齐预热连接"""
+        with self._lock:
+            slot = self._slots.get(host_base)
+            if slot is None:
+                slot = self._slots[host_base] = threading.BoundedSemaphore(self.max_sessions)
+            now = time.monotonic()
+            previous = self._last_started.get((host_base, path))
+            self._last_started[(host_base, path)] = now
+        back_to_back = previous is not None and now - previous < WARM_IDLE_SECONDS
+        with slot:
+            ws = self._take_idle(host_base, path)
+            with self._lock:
+                stats = self._host_stats(host_base)
+                stats["sessions"] += 1
+                stats["in_use"] += 1
+                if ws is not None:
+                    stats["warm_hits"] += 1
+            started = None
+            try:
+                if ws is None:
+                    ws = self._open(host_base, path)
+                started = time.perf_counter()
+                yield ws
+            finally:
+                with self._lock:
+                    stats["in_use"] -= 1
+                    if started is not None:
+                        stats["payload_ms"] += (time.perf_counter() - started) * 1000
+                if ws is not None:
+                    ws.close()
+        if self.warm_size and back_to_back:
+            self.warm(host_base, path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for host, stats in self._stats.items():
+                sessions = stats["sessions"]
+                handshakes = stats["handshakes"]
+                result[host] = {
+                    "sessions": sessions,
+                    "in_use": stats["in_use"],
+                    "handshakes": handshakes,
+                    "warm_hits": stats["warm_hits"],
+                    "warm_expired": stats["warm_expired"],
+                    "idle": sum(len(v) for k, v in self._idle.items() if k[0] == host),
+                    "avg_handshake_ms": round(stats["handshake_ms"] / handshakes, 1) if handshakes else 0.0,
+                    "avg_payload_ms": round(stats["payload_ms"] / sessions, 1) if sessions else 0.0,
+                }
+            return result
+
+
+_sessions = _SessionManager(MAX_SESSIONS_PER_HOST, WARM_SESSIONS_PER_HOST)
+
+
+class _AdmissionLimiter:
     """
-    IAT 语音听写
-    :param file_path: 原始音频文件路径
-    :return: 识别出的文本
+    讯飞调用准入控制
+      - 同时进行的调用数不超过 capacity
+      - 两条优先级队列：interactive（语音输入、朗读）总是排在 bulk（提醒批量合成）前面
+      - 队列已满立即拒绝，排队超时也拒绝，均抛出 SpeechBusyError
+      - 统计每条队列的排队深度、等待时间、拒绝次数
     """
-    if not (XFYUN_APPID and XFYUN_APIKEY and XFYUN_SECRET):
-        raise RuntimeError("讯飞密钥未配置：请设置 XFYUN_APPID / XFYUN_APIKEY / XFYUN_SECRET")
 
-    wav16k = _ensure_pcm16k(file_path)
-    with open(wav16k, "rb") as f:
-        audio_b64 = base64.b64encode(f.read()).decode("utf-8")
+    LANES = ("interactive", "bulk")
 
-    ws_url = _auth_url(IAT_HOST, IAT_PATH)
-    ws = create_connection(ws_url, sslopt={"cert_reqs": ssl.CERT_NONE})
-    try:
-        frame = {
-            "common": {"app_id": XFYUN_APPID},
-            "business": {
-                "language": language,
-                "domain": "iat",
-                "accent": "mandarin",
-                "vinfo": 1,
-                "vad_eos": 3000
-            },
-            "data": {
-                "status": 2,
-                "format": "audio/L16;rate=16000",
-                "encoding": "raw",
-                "audio": audio_b64
+    def __init__(self, capacity: int, queue_limits: dict, timeouts: dict):
+        self.capacity = capacity
+        self.queue_limits = queue_limits
+        self.timeouts = timeouts
+        self._cond = threading.Condition()
+        self._running = 0
+        self._queues = {lane: deque() for lane in self.LANES}
+        self._stats = {lane: {
+            "admitted": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        } for lane in self.LANES}
+
+    def _next_ticket(self):
+        for lane in self.LANES:
+            if self._queues[lane]:
+                return self._queues[lane][0]
+        return None
+
+    @contextmanager
+    def admit(self, lane: str = "interactive"):
+        if lane not in self.LANES:
+            raise ValueError(f"未知的优先级队列: {lane}")
+        started = time.monotonic()
+        stats = self._stats[lane]
+        with self._cond:
+            if self._running >= self.capacity or self._next_ticket() is not None:
+                if len(self._queues[lane]) >= self.queue_limits[lane]:
+                    stats["rejected"] += 1
+                    raise SpeechBusyError("语音服务繁忙，请稍后重试")
+                ticket = object()
+                self._queues[lane].append(ticket)
+                deadline = started + self.timeouts[lane]
+                while not (self._running < self.capacity and self._next_ticket() is ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queues[lane].remove(ticket)
+                        stats["timeouts"] += 1
+                        # 队首离开后，后面的请求可能可以执行了
+                        self._cond.notify_all()
+                        raise SpeechBusyError("语音服务排队超时，请稍后重试")
+                    self._cond.wait(remaining)
+                self._queues[lane].popleft()
+            self._running += 1
+            waited = (time.monotonic() - started) * 1000
+            stats["admitted"] += 1
+            stats["wait_ms"] += waited
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "running": self._running,
+                "lanes": {
+                    lane: {
+                        "queue_depth": len(self._queues[lane]),
+                        "queue_limit": self.queue_limits[lane],
+                        "admitted": stats["admitted"],
+                        "rejected": stats["rejected"],
+                        "timeouts": stats["timeouts"],
+                        "avg_wait_ms": round(stats["wait_ms"] / stats["admitted"], 1) if stats["admitted"] else 0.0,
+                        "max_wait_ms": round(stats["max_wait_ms"], 1),
+                    }
+                    for lane, stats in self._stats.items()
+                },
             }
-        }
-        ws.send(json.dumps(frame))
 
-        result_text = []
+
+_admission = _AdmissionLimiter(SPEECH_MAX_CONCURRENCY, SPEECH_QUEUE_LIMITS, SPEECH_QUEUE_TIMEOUTS)
+
+
+def admission_stats() -> dict:
+    """准入控制统计：运行中的调用数，各优先级队列的深度、等待时间和拒绝次数"""
+    return _admission.stats()
+
+
+def warm_sessions(kind: str = "tts", count: int = None):
+    """预热讯飞连接（kind: 'tts' / 'asr'），用于已知的突发请求之前"""
+    if kind == "asr":
+        _sessions.warm(IAT_HOST, IAT_PATH, count)
+    else:
+        _sessions.warm(TTS_HOST, TTS_PATH, count)
+
+
+def session_stats() -> dict:
+    """各主机的会话数、预热命中数、握手/数据收发平均耗时"""
+    return _sessions.stats()
+
+
+def _wav_pcm16k_frames(src, frame_bytes: int):
+    """
+    快速路径：src 已经是 16kHz、单声道、16bit 的 wav 时直接读取 PCM 数据，不经过 ffmpeg
+    格式不符时返回 None（src 会被重置到开头）
+    """
+    start = src.tell()
+    try:
+        wf = wave.open(src, "rb")
+    except (wave.Error, EOFError):
+        src.seek(start)
+        return None
+    if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (16000, 1, 2):
+        src.seek(start)
+        return None
+
+    def frames():
         while True:
-            msg = ws.recv()
-            if not msg:
-                break
-            resp = json.loads(msg)
-            code = resp.get("code", -1)
-            if code != 0:
-                raise RuntimeError(f"ASR error: {resp}")
-            data = resp.get("data", {})
-            status = data.get("status")
-            for seg in data.get("result", {}).get("ws", []):
-                for cw in seg.get("cw", []):
-                    result_text.append(cw.get("w", ""))
-            if status == 2:
+            chunk = wf.readframes(frame_bytes // 2)
+            if not chunk:
                 break
-        return "".join(result_text).strip()
+            yield chunk
+    return frames()
+
+
+# ffmpeg 输出 16kHz、单声道、16bit 裸 PCM
+PCM16K_OUTPUT_ARGS = ["-ar", "16000", "-ac", "1", "-acodec", "pcm_s16le", "-f", "s16le"]
+
+
+def ffmpeg_transcode(data: bytes, output_args: list) -> bytes:
+    """
+    用 ffmpeg 把整段音频转成另一种编码（stdin 输入，stdout 输出，不落盘）
+    :param output_args: 输出参数，如 ["-ac", "1", "-b:a", "24k", "-f", "mp3"]
+    同时运行的 ffmpeg 进程数受 _transcode_slots 限制
+    """
+    if not _transcode_slots.acquire(timeout=TRANSCODE_QUEUE_TIMEOUT):
+        raise RuntimeError("音频转码繁忙，请稍后重试")
+    try:
+        cmd = ["ffmpeg", "-loglevel", "error", "-i", "pipe:0"] + list(output_args) + ["pipe:1"]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate(data)
+        if proc.returncode != 0 or not out:
+            raise RuntimeError(f"ffmpeg 转码失败: {err.decode('utf-8', 'ignore').strip()}")
+        return out
     finally:
-        ws.close()
+        _transcode_slots.release()
 
 
-def tts_iflytek(text: str, voice="xiaoyan", aue="lame") -> bytes:
+def pcm16k_frames(src, fmt: str = None, frame_bytes: int = ASR_FRAME_BYTES):
     """
-    TTS 语音合成
+    把上传的音频转成 16kHz、单声道、16bit PCM 数据块，供流式识别逐帧发送
+    :param src: 可 seek 的二进制文件对象（或 bytes）
+    :param fmt: 'pcm' 表示客户端已上传 16k 单声道 16bit 裸 PCM，直接切帧
+    :return: PCM 数据块的迭代器（需要转码时返回前已转码完成，转码失败在这里直接抛出）
+    """
+    if isinstance(src, (bytes, bytearray)):
+        src = io.BytesIO(src)
+    if fmt == "pcm":
+        return iter(lambda: src.read(frame_bytes), b"")
+    frames = _wav_pcm16k_frames(src, frame_bytes)
+    if frames is not None:
+        return frames
+    # 其他格式在这里一次性转码成 PCM（受 _transcode_slots 限制），
+    # 转码不会占用识别的准入名额和讯飞会话
+    pcm = io.BytesIO(ffmpeg_transcode(src.read(), PCM16K_OUTPUT_ARGS))
+    return iter(lambda: pcm.read(frame_bytes), b"")
+
+
+def asr_iflytek_stream(pcm_frames, language="zh_cn", priority="interactive"):
+    """
+    流式 IAT 语音听写
+    发送线程按 ASR_FRAME_INTERVAL 节奏逐帧发送 PCM，调用方同时接收识别结果，
+    每收到一次结果就 yield 当前完整文本（开启动态修正，后到的结果会替换前面的片段）
+    :param pcm_frames: 16kHz、单声道、16bit PCM 数据块的可迭代对象（应已转码好，见 pcm16k_frames）
+    :param priority: 准入优先级 (interactive / bulk)，排队已满或超时抛出 SpeechBusyError
+    :return: 识别文本的生成器，最后一个值为最终结果
+    """
+    if not (XFYUN_APPID and XFYUN_APIKEY and XFYUN_SECRET):
+        raise RuntimeError("讯飞密钥未配置：请设置 XFYUN_APPID / XFYUN_APIKEY / XFYUN_SECRET")
+
+    with _admission.admit(priority), _sessions.session(IAT_HOST, IAT_PATH) as ws:
+        stop = threading.Event()
+        send_error = []
+
+        def sender():
+            status = 0
+            try:
+                for chunk in pcm_frames:
+                    if stop.is_set():
+                        return
+                    frame = {
+                        "data": {
+                            "status": status,
+                            "format": "audio/L16;rate=16000",
+                            "encoding": "raw",
+                            "audio": base64.b64encode(chunk).decode("utf-8")
+                        }
+                    }
+                    if status == 0:
+                        frame["common"] = {"app_id": XFYUN_APPID}
+                        frame["business"] = {
+                            "language": language,
+                            "domain": "iat",
+                            "accent": "mandarin",
+                            "vinfo": 1,
+                            "vad_eos": 3000,
+                            "dwa": "wpgs"
+                        }
+                    ws.send(json.dumps(frame))
+                    status = 1
+                    if ASR_FRAME_INTERVAL:
+                        time.sleep(ASR_FRAME_INTERVAL)
+                if status == 0:
+                    raise ValueError("音频为空")
+                ws.send(json.dumps({"data": {
+                    "status": 2,
+                    "format": "audio/L16;rate=16000",
+                    "encoding": "raw",
+                    "audio": ""
+                }}))
+            except Exception as e:
+                send_error.append(e)
+                # 发送失败时关闭连接，让接收端的 recv 立即返回
+                if not stop.is_set():
+                    ws.close()
+            finally:
+                # 提前结束时释放转码进程等资源
+                if hasattr(pcm_frames, "close"):
+                    pcm_frames.close()
+
+        send_thread = threading.Thread(target=sender, daemon=True)
+        send_thread.start()
+        try:
+            # sn -> 片段文本；动态修正（pgs=rpl）时替换 rg 范围内的旧片段
+            segments = {}
+            while True:
+                try:
+                    msg = ws.recv()
+                except Exception:
+                    if send_error:
+                        raise send_error[0]
+                    raise
+                if not msg:
+                    if send_error:
+                        raise send_error[0]
+                    break
+                resp = json.loads(msg)
+                code = resp.get("code", -1)
+                if code != 0:
+                    raise RuntimeError(f"ASR error: {resp}")
+                data = resp.get("data", {})
+                result = data.get("result") or {}
+                if result:
+                    if result.get("pgs") == "rpl":
+                        first, last = result.get("rg", [0, 0])
+                        for sn in range(first, last + 1):
+                            segments.pop(sn, None)
+                    text = "".join(
+                        cw.get("w", "")
+                        for seg in result.get("ws", [])
+                        for cw in seg.get("cw", [])
+                    )
+                    segments[result.get("sn", len(segments) + 1)] = text
+                    yield "".join(segments[sn] for sn in sorted(segments)).strip()
+                if data.get("status") == 2:
+                    break
+        finally:
+            stop.set()
+            send_thread.join(timeout=1)
+
+
+def asr_iflytek_file_stream(file_path: str, language="zh_cn", priority="interactive"):
+    """
+    对音频文件做流式识别：转成 16k PCM 后分帧发送，逐次 yield 识别文本
+    :param file_path: 原始音频文件路径
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    with open(file_path, "rb") as f:
+        yield from asr_iflytek_stream(pcm16k_frames(f), language=language, priority=priority)
+
+
+def asr_iflytek(file_path: str, language="zh_cn", priority="interactive") -> str:
+    """
+    IAT 语音听写
+    :param file_path: 原始音频文件路径
+    :return: 识别出的文本
+    """
+    text = ""
+    for text in asr_iflytek_file_stream(file_path, language=language, priority=priority):
+        pass
+    return text
+
+
+def tts_iflytek_stream(text: str, voice="xiaoyan", aue="lame", priority="interactive"):
+    """
+    流式 TTS：每收到一帧音频就解码并立即 yield，不等整段合成结束
+    生成器被提前关闭（如客户端断开）时会一并关闭讯飞连接
     :param text: 输入文本
     :param voice: 发音人 (xiaoyan=女声, aisjiuxu=男声)
     :param aue: 输出编码 (lame=mp3, raw=pcm)
-    :return: 音频二进制
+    :param priority: 准入优先级 (interactive / bulk)，排队已满或超时抛出 SpeechBusyError
+    :return: 音频二进制片段的生成器
     """
     if not (XFYUN_APPID and XFYUN_APIKEY and XFYUN_SECRET):
         raise RuntimeError("讯飞密钥未配置：请设置 XFYUN_APPID / XFYUN_APIKEY / XFYUN_SECRET")
 
-    ws_url = _auth_url(TTS_HOST, TTS_PATH)
-    ws = create_connection(ws_url, sslopt={"cert_reqs": ssl.CERT_NONE})
-    audio_bytes = bytearray()
-    try:
+    with _admission.admit(priority), _sessions.session(TTS_HOST, TTS_PATH) as ws:
         frame = {
             "common": {"app_id": XFYUN_APPID},
             "business": {
@@ -187,9 +631,18 @@ def tts_iflytek(text: str, voice="xiaoyan", aue="lame") -> bytes:
             data = resp.get("data", {})
             audio = data.get("audio")
             if audio:
-                audio_bytes.extend(base64.b64decode(audio))
+                yield base64.b64decode(audio)
             if data.get("status") == 2:
                 break
-        return bytes(audio_bytes)
-    finally:
-        ws.close()
+
+
+def tts_iflytek(text: str, voice="xiaoyan", aue="lame", priority="interactive") -> bytes:
+    """
+    TTS 语音合成
+    :param text: 输入文本
+    :param voice: 发音人 (xiaoyan=女声, aisjiuxu=男声)
+    :param aue: 输出编码 (lame=mp3, raw=pcm)
+    :param priority: 准入优先级 (interactive / bulk)
+    :return: 音频二进制
+    """
+    return b"".join(tts_iflytek_stream(text, voice=voice, aue=aue, priority=priority))
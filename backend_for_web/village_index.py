@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+进程内的村庄名录索引：村庄 -> 患者 / 医生的 ID、姓名、手机号
+聊天对象、群发提醒的目标人群、数据检查都按村庄取人，原来每次都 filter_by(village=...) 取出完整的 ORM 对象；
+这里启动时用一条 UNION ALL 查询把两张表的这几列读进内存，之后按村庄取人是字典查找。
+  - track()：注册 flush / commit 事件，本进程新增、修改、删除患者或医生时，在事务提交后更新索引（回滚的不更新）
+  - 其他 worker 新注册的用户：查询时距上次同步超过 sync_seconds 秒，按主键增量读取一次新行（一条查询）；
+    其他 worker 修改、删除的用户：每 reload_minutes 分钟全量重新加载一次
+  - stats()：村庄数、人数和索引占用的内存（字节）
+村庄为空的用户记在 "" 下（check_village_data 用来列出未设置村庄的用户）。
+"""
+
+import sys
+import threading
+import time
+
+from sqlalchemy import event, inspect, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from models import db, Patient, Doctor
+
+PATIENT = "patient"
+DOCTOR = "doctor"
+# 修改后需要更新索引的字段
+_WATCHED_FIELDS = ("village", "name", "phone")
+_PENDING_KEY = "village_index_changes"
+# 增量同步时回看的主键个数
+SYNC_LOOKBACK = 20
+
+
+def _key(village) -> str:
+    return sys.intern(village or "")
+
+
+def _deep_size(obj, seen: set) -> int:
+    """对象及其包含的容器、字符串占用的字节数（共享的对象只算一次）"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    return size
+
+
+class VillageIndex:
+    """
+    村庄 -> {"patient": {user_id: (姓名, 手机号)}, "doctor": {worker_id: (姓名, 手机号)}}
+    另有 ID -> 村庄 的反查表，修改村庄时从原村庄移除
+    """
+
+    def __init__(self, sync_seconds: float = 10, reload_minutes: float = 30):
+        self.sync_seconds = sync_seconds
+        self.reload_seconds = reload_minutes * 60
+        self._lock = threading.RLock()
+        self._villages = {}
+        self._village_of = {PATIENT: {}, DOCTOR: {}}
+        self._max_id = {PATIENT: 0, DOCTOR: 0}
+        self._loaded_at = None
+        self._synced_at = None
+        self.loads = 0
+        self.syncs = 0
+
+    # ---------- 加载 ----------
+
+    @staticmethod
+    def _rows_query(min_patient_id: int = 0, min_doctor_id: int = 0):
+        return union_all(
+            select(literal(PATIENT).label("kind"), Patient.user_id.label("id"), Patient.village, Patient.name, Patient.phone)
+            .where(Patient.user_id > min_patient_id),
+            select(literal(DOCTOR).label("kind"), Doctor.worker_id.label("id"), Doctor.village, Doctor.name, Doctor.phone)
+            .where(Doctor.worker_id > min_doctor_id)
+        )
+
+    def load(self) -> dict:
+        """全量加载（一条查询），返回 stats()"""
+        rows = db.session.execute(self._rows_query()).all()
+        with self._lock:
+            self._villages = {}
+            self._village_of = {PATIENT: {}, DOCTOR: {}}
+            self._max_id = {PATIENT: 0, DOCTOR: 0}
+            for kind, id_, village, name, phone in rows:
+                self._put(kind, id_, village, name, phone)
+            self._loaded_at = self._synced_at = time.monotonic()
+            self.loads += 1
+        return self.stats()
+
+    def sync(self) -> int:
+        """
+        读取其他进程新增的用户，返回读到的行数
+        回看已知最大主键之前的 SYNC_LOOKBACK 个，补上主键较小但提交较晚的行（重复的直接覆盖）
+        """
+        with self._lock:
+            min_patient_id = self._max_id[PATIENT] - SYNC_LOOKBACK
+            min_doctor_id = self._max_id[DOCTOR] - SYNC_LOOKBACK
+        rows = db.session.execute(self._rows_query(min_patient_id, min_doctor_id)).all()
+        with self._lock:
+            for kind, id_, village, name, phone in rows:
+                self._put(kind, id_, village, name, phone)
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+        return len(rows)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.reload_seconds:
+            self.load()
+        elif now - self._synced_at >= self.sync_seconds:
+            self.sync()
+
+    # ---------- 修改（调用方持有锁） ----------
+
+    def _put(self, kind: str, id_: int, village, name, phone):
+        village = _key(village)
+        old = self._village_of[kind].get(id_)
+        if old is not None and old != village:
+            self._villages[old][kind].pop(id_, None)
+        self._villages.setdefault(village, {PATIENT: {}, DOCTOR: {}})[kind][id_] = (name, phone)
+        self._village_of[kind][id_] = village
+        self._max_id[kind] = max(self._max_id[kind], id_)
+
+    def _remove(self, kind: str, id_: int):
+        old = self._village_of[kind].pop(id_, None)
+        if old is not None:
+            self._villages[old][kind].pop(id_, None)
+
+    def apply(self, changes: list):
+        """changes: [(kind, "put" / "remove", id, village, name, phone)]"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for kind, op, id_, village, name, phone in changes:
+                if op == "remove":
+                    self._remove(kind, id_)
+                else:
+                    self._put(kind, id_, village, name, phone)
+
+    # ---------- 查询 ----------
+
+    def _members(self, village: str, kind: str) -> dict:
+        self._ensure_fresh()
+        return self._villages.get(_key(village), {}).get(kind, {})
+
+    def patient_ids(self, village: str) -> list:
+        with self._lock:
+            return sorted(self._members(village, PATIENT))
+
+    def doctor_ids(self, village: str) -> list:
+        with self._lock:
+            return sorted(self._members(village, DOCTOR))
+
+    def patients(self, village: str) -> list:
+        """[{"user_id", "name", "phone"}]，按姓名排序"""
+        with self._lock:
+            members = list(self._members(village, PATIENT).items())
+        return [{"user_id": i, "name": n, "phone": p} for i, (n, p) in sorted(members, key=lambda m: (m[1][0] or "", m[0]))]
+
+    def doctors(self, village: str) -> list:
+        """[{"worker_id", "name", "phone"}]，按姓名排序"""
+        with self._lock:
+            members = list(self._members(village, DOCTOR).items())
+        return [{"worker_id": i, "name": n, "phone": p} for i, (n, p) in sorted(members, key=lambda m: (m[1][0] or "", m[0]))]
+
+    def village_of_patient(self, user_id: int):
+        """患者所在村庄，索引里没有时返回 None（调用方再查数据库）"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._village_of[PATIENT].get(user_id)
+
+    def village_of_doctor(self, worker_id: int):
+        with self._lock:
+            self._ensure_fresh()
+            return self._village_of[DOCTOR].get(worker_id)
+
+    def villages(self) -> dict:
+        """{村庄: {"doctor_count", "patient_count"}}，未设置村庄的用户在 "" 下"""
+        with self._lock:
+            self._ensure_fresh()
+            return {
+                village: {"doctor_count": len(members[DOCTOR]), "patient_count": len(members[PATIENT])}
+                for village, members in self._villages.items()
+                if members[DOCTOR] or members[PATIENT]
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            seen = set()
+            villages_bytes = _deep_size(self._villages, seen)
+            reverse_bytes = _deep_size(self._village_of, seen)
+            return {
+                "villages": sum(1 for m in self._villages.values() if m[PATIENT] or m[DOCTOR]),
+                "patients": len(self._village_of[PATIENT]),
+                "doctors": len(self._village_of[DOCTOR]),
+                "memory_bytes": villages_bytes + reverse_bytes,
+                "villages_bytes": villages_bytes,
+                "reverse_bytes": reverse_bytes,
+                "loads": self.loads,
+                "syncs": self.syncs,
+                "loaded_seconds_ago": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            }
+
+    # ---------- 事件 ----------
+
+    def track(self):
+        """注册 flush / commit 事件：flush 时记下变化，提交后更新索引，回滚时丢弃"""
+        def after_flush(session, flush_context):
+            changes = []
+            for obj in session.new:
+                entry = _entry(obj, "put")
+                if entry:
+                    changes.append(entry)
+            for obj in session.dirty:
+                if isinstance(obj, (Patient, Doctor)):
+                    attrs = inspect(obj).attrs
+                    if any(attrs[field].history.has_changes() for field in _WATCHED_FIELDS):
+                        changes.append(_entry(obj, "put"))
+            for obj in session.deleted:
+                entry = _entry(obj, "remove")
+                if entry:
+                    changes.append(entry)
+            if changes:
+                session.info.setdefault(_PENDING_KEY, []).extend(changes)
+
+        def after_commit(session):
+            changes = session.info.pop(_PENDING_KEY, None)
+            if changes:
+                self.apply(changes)
+
+        def after_rollback(session):
+            session.info.pop(_PENDING_KEY, None)
+
+        event.listen(Session, "after_flush", after_flush)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
+
+
+def _entry(obj, op: str):
+    if isinstance(obj, Patient):
+        return (PATIENT, op, obj.user_id, obj.village, obj.name, obj.phone)
+    if isinstance(obj, Doctor):
+        return (DOCTOR, op, obj.worker_id, obj.village, obj.name, obj.phone)
+    return None
@@ -41,10 +41,10 @@ Page({
 
     this.setData({ loading: true })
     const apiBase = app.globalData.API_BASE
-    console.log('正在获取医生列表，患者ID:', patientId);
-
+    // 收件箱一次返回本村所有医生，带最后一条消息和未读数，已按最近消息排序
     wx.request({
-      url: `${apiBase}/patients/${patientId}/doctors`,
+      url: `${apiBase}/chat/inbox`,
+      data: { patient_id: patientId },
       header: {
         'Content-Type': 'application/json'
       },
@@ -52,9 +52,8 @@ Page({
       success: (res) => {
         this.setData({ loading: false })
         
-        if (res.data.ok && res.data.doctors) {
-          // 为每个医生加载最后一条消息和未读数量
-          this.loadLastMessagesAndUnreadCount(res.data.doctors)
+        if (res.data.ok && res.data.conversations) {
+          this.setData({ doctorList: this.buildConversationList(res.data.conversations) })
         } else {
           wx.showToast({ title: '获取医生列表失败', icon: 'none' })
         }
@@ -67,46 +66,16 @@ Page({
     })
   },
 
-  // 加载最后一条消息和未读数量
-  loadLastMessagesAndUnreadCount(doctors) {
-    const { patientId } = this.data
-    const apiBase = app.globalData.API_BASE
-    let completedCount = 0
-    const total = doctors.length
-
-    doctors.forEach((doctor, index) => {
-      // 加载最后一条消息
-      wx.request({
-        url: `${apiBase}/chat/last_message/${patientId}/${doctor.worker_id}`,
-        success: (res) => {
-          if (res.data.ok && res.data.message) {
-            doctors[index].lastMessage = res.data.message.content
-            doctors[index].lastMessageTime = this.formatTime(res.data.message.created_at)
-          } else {
-            doctors[index].lastMessage = '暂无消息'
-            doctors[index].lastMessageTime = ''
-          }
-          completedCount++
-          if (completedCount === total) {
-            this.setData({ doctorList: doctors })
-          }
-        }
-      })
-
-      // 加载未读消息数
-      wx.request({
-        url: `${apiBase}/chat/unread_count`,
-        data: {
-          patient_id: patientId,
-          doctor_id: doctor.worker_id,
-          sender_type: 'patient' // 患者查看医生发送的未读消息
-        },
-        success: (res) => {
-          if (res.data.ok) {
-            doctors[index].unreadCount = res.data.unread_count || 0
-          }
-        }
-      })
+  // 收件箱条目转换为列表显示字段
+  buildConversationList(conversations) {
+    return conversations.map(item => {
+      const message = item.last_message
+      return {
+        ...item,
+        lastMessage: message ? message.content : '暂无消息',
+        lastMessageTime: message ? this.formatTime(message.created_at) : '',
+        unreadCount: item.unread_count || 0
+      }
     })
   },
 
@@ -39,8 +39,9 @@ Page({
     }
 
     const apiBase = app.globalData.API_BASE
+    // 一次请求取回村内全部患者及其最近一次血压，不再逐个患者请求血压历史
     wx.request({
-      url: `${apiBase}/doctors/${doctorId}/patients`,
+      url: `${apiBase}/api/doctors/${doctorId}/dashboard`,
       header: {
         'Content-Type': 'application/json'
       },
@@ -49,14 +50,13 @@ Page({
         if (res.data.ok && res.data.patients) {
           const patients = res.data.patients
           const patientCount = patients.length
-          
-          // 计算今日未录血压数
-          this.calculateTodayNoBpCount(patients, patientCount)
-          
-          // 更新管辖患者数
-          this.setData({ patientCount })
+
+          this.setData({
+            patientCount,
+            todayNoBpCount: this.calculateTodayNoBpCount(patients)
+          })
         } else {
-          console.error('获取患者列表失败:', res.data)
+          console.error('获取患者概览失败:', res.data)
         }
       },
       fail: (err) => {
@@ -65,14 +65,12 @@ Page({
     })
   },
 
-  // 计算今日未录血压数
-  calculateTodayNoBpCount(patients, patientCount) {
+  // 计算今日未录血压数（按最近一次血压的本地日期判断）
+  calculateTodayNoBpCount(patients) {
     if (!patients || patients.length === 0) {
-      this.setData({ todayNoBpCount: 0 })
-      return
+      return 0
     }
 
-    const apiBase = app.globalData.API_BASE
     // 获取今天的本地日期字符串 (YYYY-MM-DD)
     const today = new Date()
     const year = today.getFullYear()
@@ -80,49 +78,11 @@ Page({
     const day = String(today.getDate()).padStart(2, '0')
     const todayStr = `${year}-${month}-${day}`
 
-    let checkedCount = 0
-    let noBpCount = 0
-
-    patients.forEach((patient) => {
-      wx.request({
-        url: `${apiBase}/api/patients/${patient.user_id}/bp_records`,
-        method: 'GET',
-        success: (res) => {
-          checkedCount++
-          
-          let hasTodayBp = false
-          if (Array.isArray(res.data) && res.data.length > 0) {
-            // 检查是否有今天的血压记录
-            const latestRecord = res.data[0] // 已经按时间倒序排列
-            if (latestRecord && latestRecord.measured_at) {
-              // 提取日期部分进行比较
-              const recordDate = latestRecord.measured_at.split('T')[0]
-              if (recordDate === todayStr) {
-                hasTodayBp = true
-              }
-            }
-          }
-          
-          if (!hasTodayBp) {
-            noBpCount++
-          }
-
-          // 所有患者都检查完毕
-          if (checkedCount === patientCount) {
-            this.setData({ todayNoBpCount: noBpCount })
-          }
-        },
-        fail: () => {
-          checkedCount++
-          // 如果请求失败，也算作未录血压
-          noBpCount++
-          
-          if (checkedCount === patientCount) {
-            this.setData({ todayNoBpCount: noBpCount })
-          }
-        }
-      })
-    })
+    return patients.filter((patient) => {
+      const latest = patient.latest_bp
+      // 提取日期部分进行比较
+      return !(latest && latest.measured_at && latest.measured_at.split('T')[0] === todayStr)
+    }).length
   },
 
   // 点击"患者管理"跳转到 management 页面
@@ -60,7 +60,8 @@ Page({
     const apiBase = app.globalData.API_BASE
 
     wx.request({
-      url: `${apiBase}/doctors/${doctorId}/patients`,
+      // 一次请求取回村内全部患者及其最近一次血压
+      url: `${apiBase}/api/doctors/${doctorId}/dashboard`,
       header: {
         'Content-Type': 'application/json'
       },
@@ -69,8 +70,7 @@ Page({
         this.setData({ loading: false })
         
         if (res.data.ok && res.data.patients) {
-          // 为每个患者加载最新血压记录
-          this.loadLatestBpForPatients(res.data.patients)
+          this.setData({ patientList: this.buildPatientList(res.data.patients) })
         } else {
           wx.showToast({ title: '获取患者列表失败', icon: 'none' })
           this.setData({ patientList: [] })
@@ -85,66 +85,40 @@ Page({
     })
   },
 
-  // 为每个患者加载最新血压记录
-  loadLatestBpForPatients(patients) {
+  // 根据概览接口返回的最近一次血压生成列表数据
+  buildPatientList(patients) {
     if (!patients || patients.length === 0) {
-      this.setData({ patientList: [] })
-      return
+      return []
     }
 
-    const apiBase = app.globalData.API_BASE
-    const patientList = patients.map(p => ({
-      ...p,
-      avatarChar: (p.name && typeof p.name === 'string' && p.name.length > 0) ? p.name.charAt(0) : '未',
-      latestBp: null, // 最新血压
-      bpStatus: 'none' // 'normal', 'warning', 'danger', 'none'
-    }))
-
-    this.setData({ patientList })
+    return patients.map(p => {
+      let latestBp = null
+      let bpStatus = 'none' // 'normal', 'warning', 'danger', 'none'
+      const latestRecord = p.latest_bp
 
-    // 为每个患者获取最新血压
-    patients.forEach((patient, index) => {
-      wx.request({
-        url: `${apiBase}/api/patients/${patient.user_id}/bp_records`,
-        method: 'GET',
-        success: (res) => {
-          let latestBp = null
-          let bpStatus = 'none'
-
-          if (Array.isArray(res.data) && res.data.length > 0) {
-            const latestRecord = res.data[0] // 已经按时间倒序排列
-            if (latestRecord && latestRecord.systolic && latestRecord.diastolic) {
-              latestBp = {
-                systolic: latestRecord.systolic,
-                diastolic: latestRecord.diastolic,
-                measured_at: latestRecord.measured_at
-              }
-
-              // 判断血压状态
-              if (latestRecord.systolic >= 180 || latestRecord.diastolic >= 120) {
-                bpStatus = 'danger' // 危险（红色）
-              } else if (latestRecord.systolic >= 140 || latestRecord.diastolic >= 90) {
-                bpStatus = 'warning' // 警告（橙色）
-              } else {
-                bpStatus = 'normal' // 正常
-              }
-            }
-          }
+      if (latestRecord && latestRecord.systolic && latestRecord.diastolic) {
+        latestBp = {
+          systolic: latestRecord.systolic,
+          diastolic: latestRecord.diastolic,
+          measured_at: latestRecord.measured_at
+        }
 
-          // 更新对应患者的数据
-          const updatedList = [...this.data.patientList]
-          updatedList[index] = {
-            ...updatedList[index],
-            latestBp,
-            bpStatus
-          }
-          this.setData({ patientList: updatedList })
-        },
-        fail: () => {
-          // 获取失败，保持默认值
-          console.error(`获取患者 ${patient.name} 的血压记录失败`)
+        // 判断血压状态
+        if (latestRecord.systolic >= 180 || latestRecord.diastolic >= 120) {
+          bpStatus = 'danger' // 危险（红色）
+        } else if (latestRecord.systolic >= 140 || latestRecord.diastolic >= 90) {
+          bpStatus = 'warning' // 警告（橙色）
+        } else {
+          bpStatus = 'normal' // 正常
         }
-      })
+      }
+
+      return {
+        ...p,
+        avatarChar: (p.name && typeof p.name === 'string' && p.name.length > 0) ? p.name.charAt(0) : '未',
+        latestBp, // 最新血压
+        bpStatus
+      }
     })
   },
 
@@ -76,24 +76,12 @@ Page({
     if (!med) return
     const text = `${med.name}${med.time}服用`
     const apiBase = app.globalData.API_BASE
-    wx.request({
-      url: `${apiBase}/api/speak`,
-      method: 'POST',
-      header: { 'Content-Type': 'application/json' },
-      data: { text },
-      success: (res) => {
-        if (res.data && res.data.audio_url) {
-          const url = `${apiBase}${res.data.audio_url}`
-          if (this.data.innerAudioContext) {
-            this.data.innerAudioContext.src = url
-            this.data.innerAudioContext.play()
-          }
-        } else {
-          wx.showToast({ title: '语音生成失败', icon: 'none' })
-        }
-      },
-      fail: () => wx.showToast({ title: '网络错误', icon: 'none' })
-    })
+    // 流式 TTS：播放器直接请求合成接口，收到第一帧音频即可开始播放
+    const url = `${apiBase}/api/speak?stream=1&text=${encodeURIComponent(text)}`
+    if (this.data.innerAudioContext) {
+      this.data.innerAudioContext.src = url
+      this.data.innerAudioContext.play()
+    }
   },
 
   // 将某药今日服用状态持久化（本地存储）
@@ -42,9 +42,10 @@ Page({
     this.setData({ loading: true })
     const apiBase = app.globalData.API_BASE
 
-    console.log('正在获取患者列表，医生ID:', doctorId);
+    // 收件箱一次返回本村所有患者，带最后一条消息和未读数，已按最近消息排序
     wx.request({
-      url: `${apiBase}/doctors/${doctorId}/patients`,
+      url: `${apiBase}/chat/inbox`,
+      data: { doctor_id: doctorId },
       header: {
         'Content-Type': 'application/json'
       },
@@ -52,9 +53,8 @@ Page({
       success: (res) => {
         this.setData({ loading: false })
         
-        if (res.data.ok && res.data.patients) {
-          // 为每个患者加载最后一条消息和未读数量
-          this.loadLastMessagesAndUnreadCount(res.data.patients)
+        if (res.data.ok && res.data.conversations) {
+          this.setData({ patientList: this.buildConversationList(res.data.conversations) })
         } else {
           wx.showToast({ title: '获取患者列表失败', icon: 'none' })
         }
@@ -67,52 +67,16 @@ Page({
     })
   },
 
-  // 加载最后一条消息和未读数量
-  loadLastMessagesAndUnreadCount(patients) {
-    const { doctorId } = this.data
-    const apiBase = app.globalData.API_BASE
-    let completedCount = 0
-    const total = patients.length
-
-    patients.forEach((patient, index) => {
-      // 加载最后一条消息
-      wx.request({
-        url: `${apiBase}/chat/last_message/${patient.user_id}/${doctorId}`,
-        success: (res) => {
-          if (res.data.ok && res.data.message) {
-            patients[index].lastMessage = res.data.message.content
-            patients[index].lastMessageTime = this.formatTime(res.data.message.created_at)
-          } else {
-            patients[index].lastMessage = '暂无消息'
-            patients[index].lastMessageTime = ''
-          }
-          completedCount++
-          if (completedCount === total) {
-            // 按照最后消息时间排序
-            patients.sort((a, b) => {
-              if (!a.lastMessageTime) return 1
-              if (!b.lastMessageTime) return -1
-              return new Date(b.lastMessageTime) - new Date(a.lastMessageTime)
-            })
-            this.setData({ patientList: patients })
-          }
-        }
-      })
-
-      // 加载未读消息数
-      wx.request({
-        url: `${apiBase}/chat/unread_count`,
-        data: {
-          patient_id: patient.user_id,
-          doctor_id: doctorId,
-          sender_type: 'doctor' // 医生查看患者发送的未读消息
-        },
-        success: (res) => {
-          if (res.data.ok) {
-            patients[index].unreadCount = res.data.unread_count || 0
-          }
-        }
-      })
+  // 收件箱条目转换为列表显示字段
+  buildConversationList(conversations) {
+    return conversations.map(item => {
+      const message = item.last_message
+      return {
+        ...item,
+        lastMessage: message ? message.content : '暂无消息',
+        lastMessageTime: message ? this.formatTime(message.created_at) : '',
+        unreadCount: item.unread_count || 0
+      }
     })
   },
 
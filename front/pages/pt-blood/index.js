@@ -229,34 +229,11 @@ Page({
       return
     }
 
-    wx.showLoading({ title: '生成语音中...', mask: true })
     const apiBase = app.globalData.API_BASE
-
-    wx.request({
-      url: `${apiBase}/api/speak`,
-      method: 'POST',
-      header: {
-        'Content-Type': 'application/json'
-      },
-      data: {
-        text: text
-      },
-      success: (res) => {
-        wx.hideLoading()
-        if (res.data.audio_url) {
-          const audioUrl = `${apiBase}${res.data.audio_url}`
-          this.setData({ audioUrl })
-          this.playAudio(audioUrl)
-        } else {
-          wx.showToast({ title: '生成语音失败', icon: 'none' })
-        }
-      },
-      fail: (err) => {
-        wx.hideLoading()
-        console.error('TTS请求失败：', err)
-        wx.showToast({ title: '网络错误', icon: 'none' })
-      }
-    })
+    // 流式 TTS：播放器直接请求合成接口，收到第一帧音频即可开始播放，重播时命中服务端缓存
+    const audioUrl = `${apiBase}/api/speak?stream=1&text=${encodeURIComponent(text)}`
+    this.setData({ audioUrl })
+    this.playAudio(audioUrl)
   },
 
   // 播放音频
@@ -1,5 +1,6 @@
 const app = getApp()
 const { request } = require('../../utils/request')
+const { openEventStream } = require('../../utils/sse')
 
 Page({
   data: {
@@ -8,7 +9,8 @@ Page({
     replyContent: "", // 输入的提问内容
     scrollTop: 0, // 滚动位置
     patientId: null, // 患者ID
-    doctorId: null // 医生ID
+    doctorId: null, // 医生ID
+    lastMsgId: 0 // 已显示的最新消息ID（推送断开重连时从这里续传）
   },
 
   onLoad(options) {
@@ -23,15 +25,17 @@ Page({
       doctorId: doctorInfo.worker_id
     })
 
-    // 获取与该医生的历史聊天记录
-    this.getHistoryMessages()
-    
-    // 开启自动刷新消息
-    this.startMessagePolling()
+    // 历史记录加载后打开实时推送
+    this.getHistoryMessages().then(() => this.startMessageStream())
   },
   
   onUnload() {
-    // 页面卸载时清除轮询
+    // 页面卸载时关闭推送连接、清除轮询
+    this.unloaded = true
+    if (this.messageStream) {
+      this.messageStream.close()
+    }
+    clearTimeout(this.reconnectTimer)
     if (this.pollingTimer) {
       clearInterval(this.pollingTimer)
     }
@@ -39,13 +43,104 @@ Page({
     this.markAsRead()
   },
   
-  // 开启消息轮询（每3秒刷新一次）
+  // 打开新消息推送（SSE）；连接结束后带上最新消息ID重连，基础库不支持时退回轮询
+  startMessageStream() {
+    const { patientId, doctorId } = this.data
+    if (this.unloaded || !patientId || !doctorId) return
+
+    const stream = openEventStream('/chat/stream', {
+      patient_id: patientId,
+      doctor_id: doctorId,
+      after_msg_id: this.data.lastMsgId
+    }, {
+      onEvent: (event) => {
+        if (event.event === 'message') {
+          this.appendMessages([JSON.parse(event.data)])
+        } else if (event.event === 'more') {
+          // 断开期间的消息一次没有补发完，服务端随后关闭连接
+          this.needsCatchUp = true
+        }
+      },
+      onClose: (err) => {
+        if (this.unloaded) return
+        if (this.needsCatchUp) {
+          // 先分页补齐缺的消息再重连，推送的新消息不会越过没补发的部分
+          this.needsCatchUp = false
+          this.catchUpMessages().then(() => this.startMessageStream())
+          return
+        }
+        // 服务端到时关闭时立即重连，网络错误时稍等再连
+        this.reconnectTimer = setTimeout(() => this.startMessageStream(), err ? 3000 : 200)
+      }
+    })
+    if (!stream) {
+      this.startMessagePolling()
+      return
+    }
+    this.messageStream = stream
+  },
+
+  // 追加新消息（按 msg_id 去重、排序）
+  appendMessages(rawMessages) {
+    const known = {}
+    this.data.messageList.forEach(m => { known[m.msg_id] = true })
+    const added = rawMessages.filter(msg => !known[msg.msg_id]).map(msg => this.toListItem(msg))
+    if (added.length === 0) return
+
+    const messageList = this.data.messageList.concat(added).sort((a, b) => a.msg_id - b.msg_id)
+    this.setData({
+      messageList,
+      lastMsgId: messageList[messageList.length - 1].msg_id
+    }, () => {
+      this.scrollToBottom()
+    })
+  },
+
+  toListItem(msg) {
+    return {
+      msg_id: msg.msg_id,
+      type: msg.sender_type, // 'patient' 或 'doctor'
+      content: msg.content,
+      time: this.formatTime(msg.created_at)
+    }
+  },
+
+  // 开启消息轮询（每3秒刷新一次，仅在不支持推送时使用）
   startMessagePolling() {
     this.pollingTimer = setInterval(() => {
-      this.getHistoryMessages()
+      this.getNewMessages()
     }, 3000)
   },
 
+  // 按页拉取 lastMsgId 之后的消息，直到没有更多
+  async catchUpMessages() {
+    while (!this.unloaded && await this.getNewMessages()) {}
+  },
+
+  // 增量获取 lastMsgId 之后的新消息，返回是否还有更多
+  async getNewMessages() {
+    const { patientId, doctorId, lastMsgId } = this.data
+    if (!patientId || !doctorId) return
+
+    try {
+      const result = await request('/chat/messages', {
+        method: 'GET',
+        data: {
+          patient_id: patientId,
+          doctor_id: doctorId,
+          after_msg_id: lastMsgId
+        }
+      })
+      if (result.ok && result.messages) {
+        this.appendMessages(result.messages)
+        return !!result.has_more
+      }
+    } catch (error) {
+      console.error('获取新消息失败：', error)
+    }
+    return false
+  },
+
   // 获取历史消息
   async getHistoryMessages() {
     const { patientId, doctorId } = this.data
@@ -61,14 +156,11 @@ Page({
       })
       
       if (result.ok && result.messages) {
-        const messages = result.messages.map(msg => ({
-          type: msg.sender_type, // 'patient' 或 'doctor'
-          content: msg.content,
-          time: this.formatTime(msg.created_at)
-        }))
+        const messages = result.messages.map(msg => this.toListItem(msg))
         
         this.setData({
-          messageList: messages
+          messageList: messages,
+          lastMsgId: messages.length > 0 ? messages[messages.length - 1].msg_id : 0
         }, () => {
           this.scrollToBottom()
         })
@@ -98,6 +190,7 @@ Page({
         data: {
           patient_id: patientId,
           doctor_id: doctorId,
+          up_to_msg_id: this.data.lastMsgId || undefined, // 只标记已经显示过的消息
           sender_type: 'patient' // 患者标记医生发送的消息为已读
         }
       })
@@ -141,8 +234,8 @@ Page({
       })
 
       if (result.ok) {
-        // 刷新消息列表
-        this.getHistoryMessages()
+        // 直接显示发送成功的消息（推送收到同一条时按 msg_id 去重）
+        this.appendMessages([result.message])
       } else {
         wx.showToast({ title: '发送失败', icon: 'none' })
         // 恢复输入框内容
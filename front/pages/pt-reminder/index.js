@@ -203,6 +203,10 @@ Page({
     
     var audioContext = wx.createInnerAudioContext();
     var audioUrl = apiBaseUrl + reminder.audio_path;
+    // 2G/3G 网络下请求低码率音频，下载更快
+    if (that.data.network === '2G' || that.data.network === '3G') {
+      audioUrl += '?profile=low';
+    }
     console.log('音频URL:', audioUrl);
     
     audioContext.src = audioUrl;
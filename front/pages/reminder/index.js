@@ -253,26 +253,17 @@ Page({
         });
       });
 
-      if (res.statusCode === 200 && res.data.ok) {
+      if ((res.statusCode === 200 || res.statusCode === 202) && res.data.ok) {
         wx.hideLoading();
-        const successMsg = res.data.affected_patients 
-          ? `发送成功，已发送给${res.data.affected_patients}名患者` 
-          : '发送成功';
         wx.showToast({
-          title: successMsg,
+          title: '已提交，正在发送',
           icon: 'success',
           duration: 2000
         });
 
-        // 如果有部分失败，显示警告
-        if (res.data.failed_count > 0) {
-          setTimeout(() => {
-            wx.showToast({
-              title: `${res.data.failed_count}个患者发送失败`,
-              icon: 'none',
-              duration: 3000
-            });
-          }, 2200);
+        // 后台群发任务，轮询进度
+        if (res.data.job_id) {
+          this.pollReminderJob(res.data.job_id);
         }
 
         // 重置选择状态
@@ -305,5 +296,46 @@ Page({
         duration: 3000
       });
     }
+  },
+
+  // 轮询群发任务进度，完成后提示成功/失败人数
+  pollReminderJob(jobId, attempt = 0) {
+    if (attempt > 60) return;
+    wx.request({
+      url: `http://192.168.150.117:5000/api/doctor/reminders/jobs/${jobId}`,
+      method: 'GET',
+      success: (res) => {
+        const job = res.data && res.data.job;
+        if (!job) return;
+        if (job.status === 'queued' || job.status === 'running') {
+          setTimeout(() => this.pollReminderJob(jobId, attempt + 1), 2000);
+          return;
+        }
+        if (job.status === 'succeeded') {
+          wx.showToast({
+            title: `已发送给${job.success_count}名患者`,
+            icon: 'success',
+            duration: 2000
+          });
+          // 如果有部分失败，显示警告
+          if (job.failed_count > 0) {
+            setTimeout(() => {
+              wx.showToast({
+                title: `${job.failed_count}个患者发送失败`,
+                icon: 'none',
+                duration: 3000
+              });
+            }, 2200);
+          }
+        } else {
+          const firstError = job.errors && job.errors.length ? job.errors[0].error : '发送失败';
+          wx.showToast({
+            title: firstError.length > 20 ? firstError.substring(0, 20) + '...' : firstError,
+            icon: 'none',
+            duration: 3000
+          });
+        }
+      }
+    });
   }
-})
\ No newline at end of file
+})
@@ -77,4 +77,4 @@ function upload(path, filePath, name = "file", formData = {}) {
   })
 }
 
-module.exports = { request, upload }
+module.exports = { request, upload, baseUrl }
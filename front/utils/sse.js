@@ -0,0 +1,87 @@
+const { baseUrl } = require('./request')
+
+// 解析一段完整的 SSE 事件文本（以空行分隔）
+function parseEvent(block) {
+  const event = { id: null, event: 'message', data: '' }
+  const data = []
+  block.split('\n').forEach(line => {
+    if (!line || line.charAt(0) === ':') return // 空行 / 保活注释
+    const idx = line.indexOf(':')
+    const field = idx === -1 ? line : line.slice(0, idx)
+    const value = idx === -1 ? '' : line.slice(idx + 1).replace(/^ /, '')
+    if (field === 'id') event.id = value
+    else if (field === 'event') event.event = value
+    else if (field === 'data') data.push(value)
+  })
+  if (data.length === 0) return null
+  event.data = data.join('\n')
+  return event
+}
+
+// 服务端的事件流只包含 ASCII 字符，按字节直接转成字符串
+function chunkToString(buffer) {
+  const bytes = new Uint8Array(buffer)
+  let text = ''
+  for (let i = 0; i < bytes.length; i += 4096) {
+    text += String.fromCharCode.apply(null, bytes.subarray(i, i + 4096))
+  }
+  return text
+}
+
+/**
+ * 打开 Server-Sent Events 长连接（基于 wx.request 分块传输）
+ * @param {string} path 接口路径，如 /chat/stream
+ * @param {object} data 查询参数
+ * @param {object} handlers onEvent({id, event, data}) / onClose(err)：连接结束（服务端到时关闭或网络错误）
+ * @returns {{close: Function}|null} 基础库不支持分块传输时返回 null，调用方退回轮询
+ */
+function openEventStream(path, data, { onEvent, onClose } = {}) {
+  if (!wx.canIUse || !wx.canIUse('request.object.enableChunked')) {
+    return null
+  }
+  const token = wx.getStorageSync('token')
+  let buffer = ''
+  let closed = false
+
+  const task = wx.request({
+    url: baseUrl() + path,
+    method: 'GET',
+    data,
+    enableChunked: true,
+    responseType: 'arraybuffer',
+    timeout: 600000,
+    header: {
+      'Authorization': token ? `Bearer ${token}` : '',
+      'Accept': 'text/event-stream'
+    },
+    success: () => {
+      if (!closed && onClose) onClose(null)
+    },
+    fail: (err) => {
+      if (!closed && onClose) onClose(err)
+    }
+  })
+  if (!task || !task.onChunkReceived) {
+    return null
+  }
+
+  task.onChunkReceived((res) => {
+    buffer += chunkToString(res.data)
+    let end = buffer.indexOf('\n\n')
+    while (end !== -1) {
+      const event = parseEvent(buffer.slice(0, end))
+      buffer = buffer.slice(end + 2)
+      if (event && onEvent) onEvent(event)
+      end = buffer.indexOf('\n\n')
+    }
+  })
+
+  return {
+    close() {
+      closed = true
+      task.abort()
+    }
+  }
+}
+
+module.exports = { openEventStream }